@@ -1,184 +1,308 @@
-from PyQt5.QtWidgets import (QApplication, QWidget, QScrollArea,
-                             QVBoxLayout, QGroupBox, QLabel, QCheckBox,
-                             QPushButton, QSizePolicy, QHBoxLayout)
-from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QFont, QCursor, QIcon
-from PyQt5 import uic
-from functools import partial
+from PyQt5.QtWidgets import (QApplication, QWidget, QListView, QAbstractItemView,
+                             QVBoxLayout, QGroupBox, QPushButton, QHBoxLayout,
+                             QStyledItemDelegate, QStyleOptionButton, QStyle, QLineEdit,
+                             QComboBox, QListWidget, QListWidgetItem)
+from PyQt5.QtCore import (Qt, QTimer, QAbstractListModel, QModelIndex,
+                          QEvent, QRect, QRectF, QSize)
+from PyQt5.QtGui import QFont, QIcon, QColor, QPen, QPainter, QPainterPath
 import os
 import sys
-import json
 import datetime as dt
+import itertools
 import subprocess
-import sqlite3
+from bisect import bisect_left
 import ui_resources
-
-
-class NotificationError(Exception):
-    """Вызывается только из класса напоминания, если возникли какие-то проблемы"""
-    pass
-
-
-class Notification:
-    def __init__(self, time, title, text,
-                 included=True, week_days=None, month_dates=None,
-                 repeating_mode=0, song='default'):
-        if month_dates is None:
-            month_dates = []
-        if week_days is None:
-            week_days = [True for _ in range(1, 8)]
-        self.time = time  # День, час и минута напоминания
-        self.title = title  # Заголовок
-        self.text = text  # Некоторое пояснение к оповещению
-        self.included = included  # Состояние оповезения: вкл/выкл(bool)
-        self.week_days = week_days  # Дни недели, в которые приходит напоминание
-        self.month_dates = month_dates  # Конеретные даты, в которые приходит напоминание
-        self.repeating_mode = repeating_mode
-        # Режим повтора. 0 - напоминание приходит 1 раз, после чего выключается
-        #                1 - напоминание приходит в определённые дни недели
-        #                2 - напоминание приходит в определённые даты,
-        #                установленные пользователем
-        self.song = song  # Мелодия напоминания
-
-    def notify(self):
-        """Присылает напоминание"""
-        # Запускается скомпилированный .exe файл notify, отображающий уведомление
-        # Заголовок, текст и мелодия оповещения передаются как агрументы командной строки
-        command = f'notify title="{self.title}" text="{self.text}" song="{self.song}"'
-        subprocess.Popen(command)
-
-    def next_time(self):
-        """Возвращает ближайшее время прихода напоминания,
-           либо вызывает NotificationError"""
-        assert self.repeating_mode in (0, 1, 2), 'Нарушение инварианта для режима повторения'
-        if self.included:
-            current_time = dt.datetime.now()
-            if self.repeating_mode == 0:
-                time = self.time
-            elif self.repeating_mode == 1:
-                current_week_day = dt.date.today().weekday()
-                for delta_days, state in enumerate(
-                        self.week_days[current_week_day:] + self.week_days[:current_week_day]
-                ):
-                    if state:
-                        current_day = current_time.day
-                        current_month = current_time.month
-                        current_year = current_time.year
-                        time = dt.datetime(current_year,
-                                           current_month,
-                                           current_day,
-                                           self.time.hour,
-                                           self.time.minute
-                                           ) + dt.timedelta(delta_days)
-                        if time > current_time:
-                            break
-                else:
-                    time = current_time - dt.timedelta(1)
-            else:
-                time = min(self.month_dates)
-                time = dt.datetime(time.year, time.month, time.day,
-                                   self.time.hour, self.time.minute)
-            if time > current_time:
-                return time
-            else:
-                raise NotificationError('Время отправки оповещения уже прошло')
+from scheduler import Scheduler
+from recurrence import next_times, clock_epoch
+from ipc import send, ChannelError, DAEMON_PORT
+import storage
+from ui_forms import load_form
+from core import Notification, NotificationError, deliver_group, load_notifys, upcoming
+from validation import validate_notification, ValidationError
+import bulk_io
+from metrics import get_metrics, metrics_path, start_dumping
+
+
+MAX_TIMER_INTERVAL = 24 * 60 * 60 * 1000  # Максимальный интервал таймера в мс (сутки)
+NOTIFY_ROLE = Qt.UserRole  # Роль, по которой модель списка отдаёт само напоминание
+LAYOUT_BATCH_SIZE = 1000  # Сколько строк списка раскладывается за раз
+SEARCH_DELAY = 200  # Задержка поиска после ввода последнего символа (в мс)
+TIMELINE_DAYS = 7  # На сколько дней вперёд показывать приходы напоминаний
+TIMELINE_LIMIT = 1000  # Сколько приходов напоминаний показывать не больше
+WEEK_DAY_NAMES = ('Понедельник', 'Вторник', 'Среда', 'Четверг',
+                  'Пятница', 'Суббота', 'Воскресенье')
+
+
+class NotifyListModel(QAbstractListModel):
+    """Модель списка напоминаний главного окна.
+       Сама ничего не хранит и не создаёт виджетов - лишь отдаёт
+       представлению напоминания из списка MainWindow.notifys.
+       Если задан фильтр (set_filter), отдаёт только отфильтрованные напоминания.
+       В режиме "ближайшие" (set_upcoming) напоминания упорядочены по времени
+       прихода: строки хранятся отсортированными по ключу (время прихода,
+       порядковый номер), и изменённое напоминание лишь перемещается
+       на своё место двоичным поиском, без пересортировки всего списка"""
+
+    def __init__(self, notifys, parent=None):
+        super().__init__(parent)
+        self.notifys = notifys
+        self.rows = notifys  # Показываемые напоминания: все, либо отфильтрованные
+        self.ids = None  # id отфильтрованных напоминаний(None - фильтра нет)
+        self.upcoming = False
+        self.keys = []  # Ключи строк в режиме "ближайшие", в том же порядке, что и rows
+        self.row_keys = {}  # Ключи напоминаний в режиме "ближайшие": "напоминание: ключ"
+        self.sequence = {}  # Порядковые номера напоминаний: "напоминание: номер"
+        self.counter = itertools.count()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def set_filter(self, ids):
+        """Показывает только напоминания с id из ids (None - показывает все)"""
+        self.ids = ids
+        self.rebuild()
+
+    def set_upcoming(self, upcoming):
+        """Включает/выключает упорядочивание по времени прихода"""
+        self.upcoming = upcoming
+        self.rebuild()
+
+    def rebuild(self):
+        self.beginResetModel()
+        if self.ids is None:
+            notifys = self.notifys
         else:
-            raise NotificationError('Оповещение отключено')
-
-
-class NotifyWidget(QWidget):
-    """Кастомный виджет напоминаний
-       (из этих виджетов состоит список напоминаний на главном окне)"""
-
-    def __init__(self, notify, main_class):
-        super().__init__()
-        self.notify = notify
+            notifys = [notify for notify in self.notifys if notify.id in self.ids]
+        if self.upcoming:
+            # Время прихода всех напоминаний считается за один проход
+            for notify in notifys:
+                if notify not in self.sequence:
+                    self.sequence[notify] = next(self.counter)
+            self.row_keys = {notify: (dt.datetime.max if time is None else time,
+                                      self.sequence[notify])
+                             for notify, time in zip(notifys, next_times(notifys))}
+            self.rows = sorted(notifys, key=self.row_keys.__getitem__)
+            self.keys = [self.row_keys[notify] for notify in self.rows]
+        else:
+            self.row_keys = {}
+            self.keys = []
+            self.rows = notifys if notifys is self.notifys else list(notifys)
+        self.endResetModel()
+
+    def sort_key(self, notify):
+        """Ключ строки в режиме "ближайшие": выключенные и больше
+           не приходящие напоминания оказываются в конце списка"""
+        if notify not in self.sequence:
+            self.sequence[notify] = next(self.counter)
+        try:
+            time = notify.next_time()
+        except NotificationError:
+            time = dt.datetime.max
+        return time, self.sequence[notify]
+
+    def row(self, notify):
+        """Номер строки напоминания, либо None, если оно не показано"""
+        if self.upcoming:
+            key = self.row_keys.get(notify)
+            return None if key is None else bisect_left(self.keys, key)
+        try:
+            return self.rows.index(notify)
+        except ValueError:
+            return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        notify = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            return notify.title
+        if role == NOTIFY_ROLE:
+            return notify
+        return None
+
+    def append(self, notify):
+        # Новое напоминание показывается и тогда, когда задан фильтр
+        if self.rows is not self.notifys:
+            self.notifys.append(notify)
+        if self.upcoming:
+            key = self.row_keys[notify] = self.sort_key(notify)
+            row = bisect_left(self.keys, key)
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.keys.insert(row, key)
+            self.rows.insert(row, notify)
+        else:
+            row = len(self.rows)
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.rows.append(notify)
+        self.endInsertRows()
+
+    def remove(self, notify):
+        if self.rows is not self.notifys:
+            self.notifys.remove(notify)
+        row = self.row(notify)
+        if row is not None:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.rows[row]
+            if self.upcoming:
+                del self.keys[row]
+                del self.row_keys[notify]
+            self.endRemoveRows()
+        self.sequence.pop(notify, None)
+
+    def update(self, notify):
+        """Сообщает представлению, что строку с напоминанием нужно перерисовать.
+           В режиме "ближайшие" строка ещё и перемещается на новое место"""
+        row = self.row(notify)
+        if row is None:
+            return
+        if self.upcoming:
+            row = self.move(notify, row)
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def move(self, notify, row):
+        """Перемещает строку row с напоминанием notify по его новому ключу.
+           Возвращает новый номер строки"""
+        key = self.sort_key(notify)
+        self.row_keys[notify] = key
+        del self.keys[row]
+        new_row = bisect_left(self.keys, key)
+        self.keys.insert(new_row, key)
+        if new_row != row:
+            # Qt ожидает номер строки, перед которой окажется перемещаемая,
+            # в нумерации до перемещения
+            destination = new_row + 1 if new_row > row else new_row
+            self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), destination)
+            del self.rows[row]
+            self.rows.insert(new_row, notify)
+            self.endMoveRows()
+        return new_row
+
+
+class NotifyDelegate(QStyledItemDelegate):
+    """Рисует строку списка напоминаний и обрабатывает нажатия на её кнопки.
+       Рисуются только видимые строки, поэтому отрисовка не зависит от длины списка"""
+
+    ROW_HEIGHT = 63
+    RADIUS = 30  # Радиус скругления левого верхнего и правого нижнего углов
+    BORDER = 4
+
+    def __init__(self, main_class, parent=None):
+        super().__init__(parent)
         self.main_class = main_class
-        self.initUi()
-
-    def initUi(self):
-        self.setStyleSheet('''border-top: 4px solid black;
-                              border-bottom: 4px solid black;
-                              ''')
-        on_button_cursor = QCursor(Qt.PointingHandCursor)
-        self.widget_list = QHBoxLayout(self)
-        self.widget_list.setSpacing(0)
-        time = self.notify.time
-        self.time_label = QLabel(time.strftime('%H:%M'), self)
-        self.time_label.setFont(QFont('Arial', 20))
-        self.time_label.setMinimumSize(100, 50)
-        self.time_label.setMaximumHeight(50)
-        self.time_label.setStyleSheet('''background: none;
-                                         background-color: rgb(240, 240, 240);
-                                         border-left: 4px solid black;
-                                         border-top-left-radius: 30px;
-                                         ''')
-        self.widget_list.addWidget(self.time_label)
-        self.title_label = QLabel(self.notify.title)
-        title_length = len(self.notify.title)
-        self.title_label.setFont(QFont('Arial', 14))
-        self.title_label.setMinimumSize(140, 50)
-        self.title_label.setMaximumHeight(50)
-        self.title_label.setSizePolicy(QSizePolicy.MinimumExpanding, QSizePolicy.Preferred)
-        self.title_label.setStyleSheet('''background: none;
-                                          background-color: rgb(240, 240, 240);
-                                          ''')
-        self.widget_list.addWidget(self.title_label)
-        self.settings_btn = QPushButton('⚙  ', self)
-        self.settings_btn.setMaximumWidth(40)
-        self.settings_btn.setMinimumHeight(50)
-        self.settings_btn.setCursor(on_button_cursor)
-        self.settings_btn.clicked.connect(self.edit_notify)
-        self.settings_btn.setStyleSheet('''background: none;
-                                           background-color: rgb(240, 240, 240);
-                                           ''')
-        self.widget_list.addWidget(self.settings_btn)
-        self.switch = QCheckBox(self)
-        self.switch.setMaximumWidth(25)
-        self.switch.setMinimumHeight(50)
-        self.switch.setChecked(self.notify.included)
-        self.switch.setCursor(on_button_cursor)
-        self.switch.stateChanged.connect(self.change_state)
-        self.switch.setStyleSheet('''background: none;
-                                     background-color: rgb(240, 240, 240);
-                                     ''')
-        self.widget_list.addWidget(self.switch)
-        self.delete_btn = QPushButton('✖ ', self)
-        self.delete_btn.setFont(QFont('Arial', 14))
-        self.delete_btn.setMaximumWidth(40)
-        self.delete_btn.setMinimumHeight(50)
-        self.delete_btn.setCursor(on_button_cursor)
-        self.delete_btn.clicked.connect(partial(self.main_class.remove_notify, self))
-        self.delete_btn.setStyleSheet('''background: none;
-                                         background-color: rgb(240, 240, 240);
-                                         border-right: 4px solid black;
-                                         color: rgb(200, 50, 20);
-                                         border-bottom-right-radius: 30px;
-                                         ''')
-        self.widget_list.addWidget(self.delete_btn)
-
-    def change_state(self):
-        """Включает/выключает напоминание и запускает/сбрасывает таймер"""
-        self.notify.included = not self.notify.included
-        self.main_class.set_timer(self.notify)
-
-    def edit_notify(self, new_notify=False):
-        self.edit_notify_window = EditNotifyWindow(self.notify, new_notify)
-        self.edit_notify_window.show()
+        # Шрифты и перья создаются один раз, а не при каждой отрисовке
+        self.time_font = QFont('Arial', 20)
+        self.title_font = QFont('Arial', 14)
+        self.border_pen = QPen(QColor(0, 0, 0), self.BORDER)
+        self.background = QColor(240, 240, 240)
+        self.delete_color = QColor(200, 50, 20)
+
+    def sizeHint(self, option, index):
+        # Ширину строки задаёт список, от делегата нужна только высота
+        return QSize(0, self.ROW_HEIGHT)
+
+    def button_rects(self, rect):
+        """Возвращает прямоугольники кнопки настроек, переключателя и кнопки удаления"""
+        rect = rect.adjusted(self.BORDER, self.BORDER, -self.BORDER, -self.BORDER)
+        delete_rect = QRect(rect.right() - 40, rect.top(), 40, rect.height())
+        switch_rect = QRect(delete_rect.left() - 25, rect.top(), 25, rect.height())
+        settings_rect = QRect(switch_rect.left() - 40, rect.top(), 40, rect.height())
+        return settings_rect, switch_rect, delete_rect
+
+    def paint(self, painter, option, index):
+        notify = index.data(NOTIFY_ROLE)
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        # Рамка строки со скруглёнными левым верхним и правым нижним углами
+        rect = QRectF(option.rect).adjusted(self.BORDER / 2, self.BORDER / 2,
+                                            -self.BORDER / 2, -self.BORDER / 2)
+        diameter = self.RADIUS * 2
+        path = QPainterPath()
+        path.moveTo(rect.left(), rect.bottom())
+        path.lineTo(rect.left(), rect.top() + self.RADIUS)
+        path.arcTo(rect.left(), rect.top(), diameter, diameter, 180, -90)
+        path.lineTo(rect.right(), rect.top())
+        path.lineTo(rect.right(), rect.bottom() - self.RADIUS)
+        path.arcTo(rect.right() - diameter, rect.bottom() - diameter,
+                   diameter, diameter, 0, -90)
+        path.closeSubpath()
+        painter.setPen(self.border_pen)
+        painter.setBrush(self.background)
+        painter.drawPath(path)
+
+        settings_rect, switch_rect, delete_rect = self.button_rects(option.rect)
+        content = option.rect.adjusted(self.BORDER + 10, self.BORDER, 0, -self.BORDER)
+        painter.setPen(QColor(0, 0, 0))
+        painter.setFont(self.time_font)
+        time_rect = QRect(content.left(), content.top(), 100, content.height())
+        painter.drawText(time_rect, Qt.AlignVCenter | Qt.AlignLeft,
+                         notify.time.strftime('%H:%M'))
+        painter.setFont(self.title_font)
+        title_rect = QRect(time_rect.right(), content.top(),
+                           settings_rect.left() - time_rect.right(), content.height())
+        painter.drawText(title_rect, Qt.AlignVCenter | Qt.AlignLeft,
+                         painter.fontMetrics().elidedText(notify.title, Qt.ElideRight,
+                                                          title_rect.width()))
+        painter.drawText(settings_rect, Qt.AlignCenter, '⚙')
+        switch_option = QStyleOptionButton()
+        switch_option.rect = QRect(0, 0, 16, 16)
+        switch_option.rect.moveCenter(switch_rect.center())
+        switch_option.state = QStyle.State_Enabled | (
+            QStyle.State_On if notify.included else QStyle.State_Off)
+        QApplication.style().drawPrimitive(QStyle.PE_IndicatorCheckBox, switch_option, painter)
+        painter.setPen(self.delete_color)
+        painter.drawText(delete_rect, Qt.AlignCenter, '✖')
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        # Вместо настоящих кнопок в строке - нажатия по их прямоугольникам
+        if event.type() not in (QEvent.MouseMove, QEvent.MouseButtonRelease):
+            return False
+        rects = self.button_rects(option.rect)
+        hit = next((number for number, rect in enumerate(rects)
+                    if rect.contains(event.pos())), None)
+        view = self.parent()
+        if event.type() == QEvent.MouseMove:
+            view.viewport().setCursor(Qt.PointingHandCursor if hit is not None
+                                      else Qt.ArrowCursor)
+            return False
+        if event.button() != Qt.LeftButton or hit is None:
+            return False
+        notify = index.data(NOTIFY_ROLE)
+        if hit == 0:
+            self.main_class.edit_notify(notify)
+        elif hit == 1:
+            self.main_class.change_state(notify)
+        else:
+            self.main_class.remove_notify(notify)
+        return True
 
 
 class EditNotifyWindow(QWidget):
-    """Класс окна создания/редактирования напоминания"""
+    """Класс окна создания/редактирования напоминания.
+       Окно создаётся один раз и перед каждым показом
+       лишь заполняется данными напоминания(метод set_notify)"""
+
+    # Стиль поля ввода заголовка
+    TITLE_STYLESHEET = '''border: 2px solid black;
+                          border-radius: 10px;'''
+    # Стиль кнопки выбора дат повторения напоминания
+    CALENDAR_STYLESHEET = '''background-color: rgb(255, 255, 255);
+                             border: 3px solid black;
+                             border-radius: 10px;'''
+    # Стиль кнопок выбора дней недели, в которые приходит напоминание
+    WEEK_DAY_STYLESHEET = '''background-color: rgb(255, 255, 0);
+                             border: 3px solid black;
+                             border-radius: 15px;'''
 
-    def __init__(self, notify, is_new=False):
+    def __init__(self):
         super().__init__()
-        self.notify = notify
-        self.is_new = is_new  # True в том случае, когда создаётся новое напоминание
-        self.week_days = self.notify.week_days.copy()
-        self.month_dates = self.notify.month_dates.copy()
-        uic.loadUi('resources\\ui\\EditNotifyWindow.ui', self)
-        self.save = False  # Переменная save нужна чтобы closeEvent понимал
-        # когда нажата кнопка "Закрыть", а когда "Сохранить"
+        self.notify = None
+        self.is_new = False
+        self.calendar_dialog = None
+        load_form('EditNotifyWindow', self)
         self.initUi()
 
     def initUi(self):
@@ -188,43 +312,43 @@ class EditNotifyWindow(QWidget):
                              self.cht_btn, self.pt_btn, self.sb_btn,
                              self.vs_btn)
         self.setLayout(self.main_layout)
-        self.title_line.setText(self.notify.title)
-        self.plain_text.insertPlainText(self.notify.text)
-        time = self.notify.time
-        self.hours_label.setText(time.strftime('%H'))
-        self.minutes_label.setText(time.strftime('%M'))
         self.repeat_switch.stateChanged.connect(self.change_repeating)
         self.week_selection_switch.clicked.connect(self.change_repeating)
         self.calendar_selection_switch.clicked.connect(self.change_repeating)
         self.ringtone_switch.stateChanged.connect(
             lambda state: self.ringtone_selector.setEnabled(state))
-        if self.notify.repeating_mode == 1:
-            self.repeat_switch.setChecked(True)
-        elif self.notify.repeating_mode == 2:
-            self.repeat_switch.setChecked(True)
-            self.calendar_selection_switch.setChecked(True)
-            self.calendar_selection_btn.setEnabled(True)
-            for button in self.week_buttons:
-                button.setEnabled(False)
-        if self.notify.song is None:
-            self.ringtone_switch.setCheckState(False)
         self.enlarge_hours_btn.clicked.connect(self.enlarge_hours)
         self.enlarge_minutes_btn.pressed.connect(self.enlarge_minutes)
         self.reduce_hours_btn.clicked.connect(self.reduce_hours)
         self.reduce_minutes_btn.clicked.connect(self.reduce_minutes)
-        for index, button in enumerate(self.week_buttons):
+        for button in self.week_buttons:
             button.clicked.connect(self.select_week_date)
-            if not self.week_days[index]:
-                button.setStyleSheet('''border: 3px solid;
-                                        border-radius: 15px;
-                                        background-color: rgb(108, 108, 108);
-                                        ''')
         self.calendar_selection_btn.clicked.connect(self.select_calendar_dates)
-        if self.notify.song:
-            self.ringtone_selector.setCurrentText(self.notify.song)
         self.apply_btn.clicked.connect(self.apply)
         self.close_btn.clicked.connect(self.close)
 
+    def set_notify(self, notify, is_new=False):
+        """Заполняет окно данными напоминания notify"""
+        self.notify = notify
+        self.is_new = is_new  # True в том случае, когда создаётся новое напоминание
+        # (оно ещё не добавлено в список и попадёт туда только после сохранения)
+        self.week_days = notify.week_days.copy()
+        self.month_dates = notify.month_dates.copy()
+        self.title_line.setText(notify.title)
+        self.plain_text.setPlainText(notify.text)
+        self.hours_label.setText(notify.time.strftime('%H'))
+        self.minutes_label.setText(notify.time.strftime('%M'))
+        self.repeat_switch.setChecked(notify.repeating_mode != 0)
+        self.week_selection_switch.setChecked(notify.repeating_mode != 2)
+        self.calendar_selection_switch.setChecked(notify.repeating_mode == 2)
+        self.change_repeating(None)
+        self.ringtone_switch.setChecked(notify.song is not None)
+        if notify.song:
+            self.ringtone_selector.setCurrentText(notify.song)
+        self.reset_styles()
+        if self.calendar_dialog is not None:
+            self.calendar_dialog.close()
+
     def change_repeating(self, _):
         """Включает/выключает повторение напоминания по дням
            и включает/выключает кнопки выбора режима повторения"""
@@ -291,50 +415,52 @@ class EditNotifyWindow(QWidget):
 
     def select_calendar_dates(self):
         """Открывает окно для выбора конкретных дат повтора напоминания"""
-        self.calendar_dialog = CalendarDialog(self.month_dates)
+        if self.calendar_dialog is None:
+            self.calendar_dialog = CalendarDialog()
+        self.calendar_dialog.set_dates(self.month_dates)
         self.calendar_dialog.show()
+        self.calendar_dialog.activateWindow()
 
-    def apply(self):
-        """Применяет изменения"""
-        stylesheet_1 = '''border: 2px solid black;
-                          border-radius: 10px;'''
-        # Стиль поля ввода заголовка
-        stylesheet_2 = '''background-color: rgb(255, 255, 255);
-                          border: 3px solid black;
-                          border-radius: 10px;'''
-        # Стиль кнопки выбора дат повторения напоминания
-        stylesheet_3 = '''background-color: rgb(255, 255, 0);
-                          border: 3px solid black;
-                          border-radius: 15px;'''
-        # Стиль кнопок выбора дней недели, в которые приходит напоминание
-        # Устанавливаем стандартные стили:
-        self.title_line.setStyleSheet(stylesheet_1)
-        self.calendar_selection_btn.setStyleSheet(stylesheet_2)
+    def reset_styles(self):
+        """Устанавливает стандартные стили(убирает красную подсветку ошибок)"""
+        self.title_line.setStyleSheet(self.TITLE_STYLESHEET)
+        self.calendar_selection_btn.setStyleSheet(self.CALENDAR_STYLESHEET)
         for button, week_day in zip(self.week_buttons, self.week_days):
             if week_day:
-                stylesheet_3 = stylesheet_3.replace('(108, 108, 108)', '(255, 255, 0)')
+                button.setStyleSheet(self.WEEK_DAY_STYLESHEET)
             else:
-                stylesheet_3 = stylesheet_3.replace('(255, 255, 0)', '(108, 108, 108)')
-            button.setStyleSheet(stylesheet_3)
-        # Если поле отсутствует заголовок, подсвечиваем поле ввода красным - так нельзя
-        if not self.title_line.text():
-            self.title_line.setStyleSheet(stylesheet_1.replace('black', 'red'))
-            return
-        # Если заголовок слишком длинный, подсвечиваем поле ввода красным - так нельзя
-        if QPushButton(self.title_line.text(), self).sizeHint().width() > 180:
-            self.title_line.setStyleSheet(stylesheet_1.replace('black', 'red'))
-            return
-        # Если даты повтора не выбраны, подсвечиваем кнопку выбора дат - так нельзя
-        if self.repeat_switch.isChecked() and \
-                self.calendar_selection_switch.isChecked() and not self.month_dates:
-            self.calendar_selection_btn.setStyleSheet(stylesheet_2.replace('black', 'red'))
-            return
-        # Если не выбраны дни недели, в которые повторяется напоминание,
-        # подсвечиваем соответствующие кнопки - так нельзя
-        if self.repeat_switch.isChecked() and not any(self.week_days):
-            stylesheet_3 = stylesheet_3.replace('black', 'red')
-            for button in self.week_buttons:
-                button.setStyleSheet(stylesheet_3)
+                button.setStyleSheet(self.WEEK_DAY_STYLESHEET.replace('(255, 255, 0)',
+                                                                      '(108, 108, 108)'))
+
+    def apply(self):
+        """Применяет изменения"""
+        self.reset_styles()
+        if self.repeat_switch.isChecked():
+            if self.week_selection_switch.isChecked():
+                repeating_mode = 1
+            else:
+                repeating_mode = 2
+        else:
+            repeating_mode = 0
+        # Поля проверяются по тем же правилам, что и при импорте из файла.
+        # Неверно заполненное поле подсвечивается красным
+        try:
+            validate_notification(self.title_line.text(), repeating_mode,
+                                  storage.week_days_to_mask(self.week_days),
+                                  self.month_dates)
+            # Заголовок должен помещаться на кнопку в списке напоминаний
+            if QPushButton(self.title_line.text(), self).sizeHint().width() > 180:
+                raise ValidationError('title', 'Слишком длинный заголовок')
+        except ValidationError as error:
+            if error.field == 'title':
+                self.title_line.setStyleSheet(self.TITLE_STYLESHEET.replace('black', 'red'))
+            elif error.field == 'dates':
+                self.calendar_selection_btn.setStyleSheet(
+                    self.CALENDAR_STYLESHEET.replace('black', 'red'))
+            elif error.field == 'week_days':
+                stylesheet = self.WEEK_DAY_STYLESHEET.replace('(255, 255, 0)', '(108, 108, 108)')
+                for button in self.week_buttons:
+                    button.setStyleSheet(stylesheet.replace('black', 'red'))
             return
 
         # Изменяем параметры напоминания на новые(применяем изменения):
@@ -346,20 +472,13 @@ class EditNotifyWindow(QWidget):
                                        int(self.minutes_label.text()))
         self.notify.week_days = self.week_days
         self.notify.month_dates = self.month_dates
-        if self.repeat_switch.isChecked():
-            if self.week_selection_switch.isChecked():
-                self.notify.repeating_mode = 1
-            else:
-                self.notify.repeating_mode = 2
-        else:
-            self.notify.repeating_mode = 0
+        self.notify.repeating_mode = repeating_mode
         if self.ringtone_switch.checkState():
             self.notify.song = self.ringtone_selector.currentText()
         else:
             self.notify.song = None
-        # Обновляем виджет напоминания:
-        window.update_notify_widget(self.notify)
-        self.save = True
+        # Обновляем напоминание в списке:
+        window.update_notify(self.notify, self.is_new)
         self.close()
 
     def keyPressEvent(self, event):
@@ -370,19 +489,13 @@ class EditNotifyWindow(QWidget):
         elif event.key() == 16777216:
             self.close()
 
-    def closeEvent(self, _):
-        # Если создавалось новое напоминание, но изменения не были приняты,
-        # это напоминание следует удалить:
-        if self.is_new and not self.save:
-            window.remove_notify(window.notifys_widgets[self.notify])
-
 
 class CalendarDialog(QWidget):
-    def __init__(self, dates):
+    def __init__(self):
         super().__init__()
-        self.notify_dates = dates  # Уже существующие даты повтора напоминания
-        self.dates = dates.copy()  # В этот список будут добавляться новые даты
-        uic.loadUi('resources\\ui\\CalendarDialog.ui', self)
+        self.notify_dates = []  # Уже существующие даты повтора напоминания
+        self.dates = []  # В этот список будут добавляться новые даты
+        load_form('CalendarDialog', self)
         self.initUi()
 
     def initUi(self):
@@ -391,11 +504,17 @@ class CalendarDialog(QWidget):
         self.dates_list.ScrollMode()
         self.calendar_widget.clicked.connect(self.add_date)
         self.dates_list.itemActivated.connect(self.remove_date)
-        for date in self.dates:
-            self.dates_list.addItem(date.strftime("%d/%m/%Y"))
         self.apply_btn.clicked.connect(self.apply)
         self.cancel_btn.clicked.connect(self.close)
 
+    def set_dates(self, dates):
+        """Заполняет окно датами повтора редактируемого напоминания"""
+        self.notify_dates = dates
+        self.dates = dates.copy()
+        self.dates_list.clear()
+        for date in self.dates:
+            self.dates_list.addItem(date.strftime("%d/%m/%Y"))
+
     def add_date(self):
         date = self.calendar_widget.selectedDate().toPyDate()
         if date not in self.dates and date >= dt.date.today():
@@ -416,19 +535,69 @@ class CalendarDialog(QWidget):
         self.close()
 
 
+class TimelineWindow(QWidget):
+    """Окно с приходами напоминаний на ближайшие TIMELINE_DAYS дней по порядку"""
+
+    def __init__(self):
+        super().__init__()
+        self.initUi()
+
+    def initUi(self):
+        icon = QIcon(os.getcwd() + '\\resources\\images\\icon.ico')
+        self.setWindowIcon(icon)
+        self.setWindowTitle(f'Ближайшие {TIMELINE_DAYS} дней')
+        self.setGeometry(550, 250, 400, 450)
+        self.timeline_list = QListWidget(self)
+        self.timeline_list.setFont(QFont('Arial', 12))
+        self.timeline_list.setUniformItemSizes(True)
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.timeline_list)
+
+    def set_notifys(self, notifys):
+        """Заполняет окно приходами напоминаний. Приходы достаются лениво
+           и по порядку, поэтому считаются только показанные"""
+        self.timeline_list.clear()
+        now = dt.datetime.now()
+        end = dt.datetime.combine(now.date() + dt.timedelta(TIMELINE_DAYS), dt.time())
+        header_font = QFont('Arial', 12, QFont.Bold)
+        day = None
+        count = 0
+        for time, notify in itertools.islice(upcoming(notifys, now, end), TIMELINE_LIMIT):
+            # Приходы одного дня идут под заголовком с датой
+            if time.date() != day:
+                day = time.date()
+                header = QListWidgetItem(
+                    f'{WEEK_DAY_NAMES[day.weekday()]}, {day.strftime("%d/%m/%Y")}')
+                header.setFont(header_font)
+                header.setFlags(Qt.NoItemFlags)
+                self.timeline_list.addItem(header)
+            self.timeline_list.addItem(f'{time.strftime("%H:%M")}  {notify.title}')
+            count += 1
+        if not count:
+            self.timeline_list.addItem('Напоминаний нет')
+        elif count == TIMELINE_LIMIT:
+            self.timeline_list.addItem('...')
+
+
 class MainWindow(QWidget):
     """Основное окно приложения со списком напоминаний"""
 
     def __init__(self):
         super().__init__()
         self.activateWindow()
-        self.timers = {}  # Таймеры, отсчитывающие время до уведомлений
+        self.scheduler = Scheduler()  # Очередь напоминаний по времени прихода
+        self.timer = QTimer(self)  # Единственный таймер, отсчитывающий время до ближайшего
+        self.timer.setSingleShot(True)
+        # Долгие интервалы Qt по умолчанию отмеряет с точностью до секунды,
+        # и напоминание могло бы опоздать почти на секунду
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.timeout)
         self.notifys = load_notifys()  # Список напоминаний
-        self.notifys_widgets = {}  # Список виджетов напоминаний
+        self.removed_ids = []  # id удалённых, но ещё не стёртых из базы данных напоминаний
+        self.edit_notify_window = None
+        self.timeline_window = None
         self.set_timers()
         self.initUI()
-        self.show_notifys()
-        self.resize_notifys_list()
 
     def initUI(self):
         icon = QIcon(os.getcwd() + '\\resources\\images\\icon.ico')
@@ -440,19 +609,52 @@ class MainWindow(QWidget):
                               background-repeat: no-repeat;
                               background-color: rgb(240, 240, 240);
                               ''')
+        self.search_line = QLineEdit(self)
+        self.search_line.setPlaceholderText('Поиск по заголовкам и текстам')
+        self.search_line.setFont(QFont('Arial', 12))
+        self.search_line.setClearButtonEnabled(True)
+        self.search_line.setStyleSheet('''background: none;
+                                          background-color: rgb(255, 255, 255);
+                                          border: 2px solid;
+                                          border-radius: 10px;''')
+        self.sort_selector = QComboBox(self)
+        self.sort_selector.addItems(['По порядку', 'Ближайшие'])
+        self.sort_selector.setFont(QFont('Arial', 12))
+        self.sort_selector.setStyleSheet('''background: none;
+                                            background-color: rgb(255, 255, 255);''')
+        self.sort_selector.currentIndexChanged.connect(
+            lambda index: self.model.set_upcoming(index == 1))
+        # Поиск запускается, когда пользователь перестал печатать
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY)
+        self.search_timer.timeout.connect(self.search)
+        self.search_line.textChanged.connect(self.search_timer.start)
         self.group_box = QGroupBox("Ваши напоминания")
         self.group_box.setStyleSheet('border: none;')
-        self.notify_list = QVBoxLayout(self)
-        # notify_list - лейаут с виджетами напоминаний(список напоминаний)
-        self.notify_list.setSpacing(0)
-        self.group_box.setLayout(self.notify_list)
-        self.scroll = QScrollArea()
-        # Список будет прокручиваемым благодаря QScrollArea
-        self.scroll.setWidget(self.group_box)
-        self.scroll.setWidgetResizable(True)
-        self.scroll.setStyleSheet('border: 3px solid black;')
+        self.model = NotifyListModel(self.notifys, self)
+        self.notify_list = QListView()
+        # notify_list - список напоминаний. Строки одинаковой высоты
+        # рисует делегат, и только те, что видны на экране
+        self.notify_list.setModel(self.model)
+        self.notify_list.setItemDelegate(NotifyDelegate(self, self.notify_list))
+        self.notify_list.setUniformItemSizes(True)
+        # Строки раскладываются порциями, поэтому вставка, удаление
+        # и перемещение строки не заставляют раскладывать весь список сразу
+        self.notify_list.setLayoutMode(QListView.Batched)
+        self.notify_list.setBatchSize(LAYOUT_BATCH_SIZE)
+        self.notify_list.setMouseTracking(True)
+        self.notify_list.setSelectionMode(QAbstractItemView.NoSelection)
+        self.notify_list.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.notify_list.setStyleSheet('border: 3px solid black;')
+        group_layout = QVBoxLayout(self.group_box)
+        group_layout.addWidget(self.notify_list)
         self.layout = QVBoxLayout(self)
-        self.layout.addWidget(self.scroll)
+        search_layout = QHBoxLayout()
+        search_layout.addWidget(self.search_line, 1)
+        search_layout.addWidget(self.sort_selector)
+        self.layout.addLayout(search_layout)
+        self.layout.addWidget(self.group_box)
         self.add_notify_btn = QPushButton('Добавить напоминание', self)
         self.add_notify_btn.setFont(QFont('Arial', 14))
         self.add_notify_btn.clicked.connect(self.add_notify)
@@ -463,180 +665,185 @@ class MainWindow(QWidget):
                                              border: 2px solid;
                                              border-radius: 17px;
                                              ''')
+        self.timeline_btn = QPushButton(f'{TIMELINE_DAYS} дней', self)
+        self.timeline_btn.setFont(QFont('Arial', 14))
+        self.timeline_btn.clicked.connect(self.show_timeline)
+        self.timeline_btn.setFixedHeight(40)
+        self.timeline_btn.setStyleSheet('''background: none;
+                                           background-color: rgb(255, 255, 255);
+                                           border: 2px solid;
+                                           border-radius: 17px;
+                                           ''')
         self.button_layout = QHBoxLayout()
         self.button_layout.addWidget(self.add_notify_btn)
+        self.button_layout.addWidget(self.timeline_btn)
         self.layout.addLayout(self.button_layout)  # Чтобы кнопка всегда находилась по центру
 
-    def resize_notifys_list(self):
-        # При любом изменении списка уведомлений высота списка должна корректироваться,
-        # иначе будут изменяться пропорции виджетов напоминаний
-        self.group_box.setFixedHeight(int(len(self.notifys) * 63.36 + 40))
-
-    def show_notifys(self):
-        """Отрисовывает все напоминания"""
-        for index, notify in enumerate(self.notifys):
-            notify_widget = NotifyWidget(notify, self)
-            self.notifys_widgets[notify] = notify_widget
-            self.notify_list.addWidget(notify_widget)
+    def search(self):
+        """Показывает в списке только напоминания, подходящие под поисковый запрос"""
+        query = self.search_line.text()
+        if not query.strip():
+            self.model.set_filter(None)
+            return
+        # Ищется по базе данных, поэтому несохранённые изменения сначала сохраняются
+        self.save_notifys()
+        self.model.set_filter(storage.get_database().search(query))
 
     def add_notify(self):
-        # Создаём пустое напоминание:
+        # Создаём пустое напоминание, но не добавляем его в список,
+        # и даём пользователю отредактировать новое напоминание.
+        # В список оно попадёт только когда пользователь сохранит изменения
         new_notify = Notification(dt.datetime.now(), '', '')
-        self.notifys.append(new_notify)
-        # Создаём виджет для напоминания, но не отображаем его:
-        new_notify_widget = NotifyWidget(new_notify, self)
-        self.notifys_widgets[new_notify] = new_notify_widget
-        # И даём пользователю отредактировать новое напоминание
-        # Если пользователь отменит создание, созданное напоминание будет удалено
-        new_notify_widget.edit_notify(new_notify=True)
-        # new_notify=True говорит о том что редактируется новое напоминание,
-        # и при отмене редактирования его следует удалить
-
-    def remove_notify(self, notify_widget):
-        notify = notify_widget.notify
+        self.edit_notify(new_notify, is_new=True)
+
+    def edit_notify(self, notify, is_new=False):
+        # Окно редактирования одно на всё приложение и не пересоздаётся
+        if self.edit_notify_window is None:
+            self.edit_notify_window = EditNotifyWindow()
+        self.edit_notify_window.set_notify(notify, is_new)
+        self.edit_notify_window.show()
+        self.edit_notify_window.activateWindow()
+
+    def show_timeline(self):
+        """Показывает приходы напоминаний на ближайшие дни"""
+        if self.timeline_window is None:
+            self.timeline_window = TimelineWindow()
+        self.timeline_window.set_notifys(self.notifys)
+        self.timeline_window.show()
+        self.timeline_window.activateWindow()
+
+    def change_state(self, notify):
+        """Включает/выключает напоминание и запускает/сбрасывает таймер"""
+        notify.included = not notify.included
+        self.model.update(notify)
+        self.set_timer(notify)
+
+    def remove_notify(self, notify):
         # Удаляем напоминание:
-        self.notifys.remove(notify)
-        # Удаляем виджет:
-        notify_widget.close()
-        del self.notifys_widgets[notify]
-        self.notify_list.removeWidget(notify_widget)
-        # Удаляем таймер:
-        timer = self.timers.get(notify)
-        if timer is not None:
-            if timer.isActive():
-                timer.stop()
-            del timer
-        self.resize_notifys_list()
-
-    def update_notify_widget(self, notify):
-        """Переписывает заголовок и время напоминания"""
-        widget = self.notifys_widgets[notify]
-        widget.time_label.setText(notify.time.strftime('%H:%M'))
-        widget.title_label.setText(notify.title)
-        # Если виджет только создан и ещё не отображён, то он отображается:
-        if widget.visibleRegion().isEmpty():
-            self.notify_list.addWidget(widget)
+        self.model.remove(notify)
+        if notify.id is not None:
+            self.removed_ids.append(notify.id)
+        # Убираем напоминание из очереди:
+        self.scheduler.discard(notify)
+        self.restart_timer()
+        # Удалённое напоминание нельзя сохранить из окна редактирования,
+        # иначе оно снова появится в списке и в базе данных
+        if self.edit_notify_window is not None and self.edit_notify_window.notify is notify:
+            self.edit_notify_window.close()
+
+    def update_notify(self, notify, is_new=False):
+        """Перерисовывает напоминание после редактирования"""
+        # Если напоминание только создано, оно добавляется в список:
+        if is_new:
+            self.model.append(notify)
+        else:
+            self.model.update(notify)
         self.set_timer(notify)
-        self.resize_notifys_list()
 
     def set_timer(self, notify):
-        """Запускает/останавливает таймер до напоминания"""
-        timer = self.timers.get(notify)
+        """Ставит напоминание в очередь планировщика, либо убирает его оттуда"""
         try:
-            interval = notify.next_time() - dt.datetime.now()
-            if timer is not None and timer.isActive():
-                timer.stop()
-            else:
-                timer = QTimer()
-                self.timers[notify] = timer
-                timer.timeout.connect(partial(self.timeout, notify))
-            timer.setInterval(int(interval.total_seconds() * 1000))
-            timer.start()
+            self.scheduler.schedule(notify, notify.next_time())
         except NotificationError:
-            if timer is not None and timer.isActive():
-                timer.stop()
+            self.scheduler.discard(notify)
+        self.restart_timer()
 
     def set_timers(self):
-        """Устанавливает таймеры на все напоминания"""
-        for notify in self.notifys:
-            self.set_timer(notify)
-
-    def timeout(self, notify):
-        """Присылает напоминание"""
-        notify.notify()
-        self.timers[notify].stop()
+        """Ставит в очередь все напоминания"""
+        # Время прихода всех напоминаний считается за один проход
+        # и запоминается в самих напоминаниях
+        epoch = clock_epoch(dt.datetime.now())
+        for notify, time in zip(self.notifys, next_times(self.notifys)):
+            notify.remember_next_time(time, epoch)
+            if time is not None:
+                self.scheduler.schedule(notify, time)
+        self.restart_timer()
+
+    def restart_timer(self):
+        """Заводит единственный таймер до ближайшего напоминания"""
+        self.timer.stop()
+        # Напоминания, которые придут почти одновременно с ближайшим,
+        # pop_due достанет вместе с ним, и они покажутся одним окном
+        deadline = self.scheduler.next_deadline()
+        if deadline is None:
+            return
+        interval = (deadline - dt.datetime.now()).total_seconds() * 1000
+        # QTimer не умеет ждать дольше ~24 суток, поэтому долгое ожидание
+        # разбивается на части: по таймауту очередь просто проверяется снова
+        self.timer.start(int(min(max(interval, 0), MAX_TIMER_INTERVAL)))
+
+    def timeout(self):
+        """Присылает все наступившие напоминания"""
+        get_metrics().increment('timer_wakeups')
+        due = self.scheduler.pop_due()
+        try:
+            deliver_group(due)
+        except Exception:
+            # Например, текст напоминания не прочитать из занятой базы данных.
+            # Исключение из слота завершило бы приложение вместе с несохранёнными
+            # изменениями, а напоминания ниже всё равно ставятся в очередь на следующий раз
+            get_metrics().increment('delivery_errors')
+        for time, notify in due:
+            try:
+                self.scheduler.schedule(notify, notify.next_time(time))
+            except NotificationError:
+                pass
+            # Время прихода изменилось - в режиме "ближайшие" строка перемещается
+            self.model.update(notify)
+        self.restart_timer()
 
     def save_notifys(self):
-        """Сохраняет данные о всех напоминаниях в базу данных"""
-        connection = sqlite3.connect('database\\notifications_db.db')
-        # Удалим все напоминания и запишем по новой:
-        cursor = connection.cursor()
-        cursor.execute('DELETE FROM notifications')
-        for id_, notify in enumerate(self.notifys):
-            cursor.execute('''INSERT INTO notifications
-                              (id, datetime, title, text, included, repeating_mode, song)
-                              VALUES
-                              (?, ?, ?, ?, ?, ?, ?)''',
-                           (id_, notify.time, notify.title, notify.text,
-                            notify.included, notify.repeating_mode, notify.song))
-        connection.commit()
-        connection.close()
-
-        # Сохранение атрибутов напоминаний, являющихся массивами, в json файлы,
-        # т. к. одной ячейки таблицы не хватит для записи массива:
-        with open('database\\week_days.json', 'w', encoding='utf-8') as json_file:
-            week_days = {id_: notify.week_days for id_, notify in enumerate(self.notifys)}
-            json_file.write(json.dumps(week_days, indent=2))
-        with open('database\\month_dates.json', 'w', encoding='utf-8') as json_file:
-            month_dates = {id_: notify.month_dates for id_, notify in enumerate(self.notifys)}
-            for id_, dates in month_dates.items():
-                month_dates[id_] = [f'{date.year}/{date.month}/{date.day}' for date in dates]
-            json_file.write(json.dumps(month_dates, indent=2))
-
-    def resizeEvent(self, e):
-        self.resize_notifys_list()
+        """Сохраняет изменённые напоминания в базу данных"""
+        changed = [notify for notify in self.notifys if notify.dirty]
+        if not changed and not self.removed_ids:
+            return
+        storage.get_database().save(changed, self.removed_ids)
+        self.removed_ids.clear()
+        for notify in changed:
+            notify.dirty = False
+            # Сохранённый текст теперь можно прочитать из базы данных
+            notify.unload_text()
 
     def closeEvent(self, e):
         self.hide()
-        # В файл state.txt записывается closed, чтобы модуль приложения,
-        # отвечающий за фоновую работу, понимал что основной модуль закрыт
-        # и программа должна работать в фоне
-        with open('state.txt', 'w') as state_file:
-            state_file.write('closed')
+        self.timer.stop()
         self.save_notifys()
-        # Запуск форового модуля:
-        subprocess.Popen('background_working')
-
-
-def load_notifys():
-    """Загружает напоминания из базы данных sqlite и json файлов"""
-    # Сначала подгружаем только те атрибуты напоминаний,
-    # которые представлены списками и хранятся в json файлах:
-    with open('database\\week_days.json', 'r', encoding='utf-8') as json_file:
         try:
-            data = json.loads(json_file.read())
-        except json.JSONDecodeError:
-            data = {}
-        week_days = {}
-        for id_, days in data.items():
-            week_days[int(id_)] = days
-    with open('database\\month_dates.json', 'r', encoding='utf-8') as json_file:
-        try:
-            data = json.loads(json_file.read())
-        except json.JSONDecodeError:
-            data = {}
-        month_dates = {}
-        for id_, dates in data.items():
-            dates = [dt.datetime.strptime(date, '%Y/%m/%d').date() for date in dates]
-            month_dates[int(id_)] = dates
-    # week_days и month_days - словари, где ключи это id напоминаний,
-    # а значения - списки с соответствующими данными
-
-    # Загружаем все остальные данные из БД:
-    connection = sqlite3.connect('database\\notifications_db.db')
-    cursor = connection.cursor()
-    data = cursor.execute('SELECT * FROM notifications').fetchall()
-    connection.close()
-    # Приводим к необходимому формату и создаём объекты напоминаний:
-    data = [list(row) for row in data]
-    notifications = []
-    for row in data:
-        row[1] = dt.datetime.strptime(row[1], '%Y-%m-%d %H:%M:%S')
-        row[2] = str(row[2])
-        row[3] = str(row[3])
-        row[4] = bool(row[4])
-        row.insert(5, week_days[row[0]])
-        row.insert(6, month_dates[row[0]])
-        notifications.append(Notification(*row[1:]))
-    return notifications
+            get_metrics().dump(metrics_path('main'))
+        except OSError:
+            pass
+        # Фоновый модуль перечитывает сохранённые напоминания и продолжает работу
+        hand_over()
+
+
+def take_over():
+    """Сообщает фоновому модулю, что напоминания теперь присылает основной модуль.
+       Возвращает управление только после того, как фоновый модуль остановился,
+       поэтому одно и то же напоминание не может прийти дважды"""
+    try:
+        send(DAEMON_PORT, {'command': 'pause', 'profile': os.path.realpath(storage.DB_PATH)})
+    except ChannelError:
+        # Фоновый модуль не запущен. Он запускается приостановленным,
+        # т. к. отложенные уведомления присылает только он
+        subprocess.Popen(['background_working', '--paused'])
+
+
+def hand_over():
+    """Передаёт отправку напоминаний фоновому модулю"""
+    try:
+        send(DAEMON_PORT, {'command': 'resume', 'profile': os.path.realpath(storage.DB_PATH)})
+    except ChannelError:
+        # Фоновый модуль ещё не запущен - запускаем
+        subprocess.Popen('background_working')
 
 
 if __name__ == '__main__':
-    with open('state.txt', 'w') as f:
-        f.write('working')
-    # В файл state.txt записывается working, чтобы модуль приложения,
-    # отвечающий за фоновую работу, понимал что основной модуль открыт
-    # и нужно прекращать свою работу
+    # Импорт и экспорт напоминаний работают без интерфейса
+    if sys.argv[1:2] in (['import'], ['export']):
+        bulk_io.main(sys.argv[1:])
+        sys.exit(0)
+    take_over()
+    start_dumping('main')
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
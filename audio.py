@@ -0,0 +1,81 @@
+"""Воспроизведение звуков уведомлений.
+
+   Все встроенные мелодии загружаются в память один раз, при запуске
+   процесса notify (QSoundEffect декодирует wav файл целиком), поэтому
+   при показе уведомления не читается ни одного файла и не создаётся
+   ни одного потока"""
+from PyQt5.QtCore import QObject, QUrl
+from PyQt5.QtMultimedia import QSoundEffect
+from collections import OrderedDict
+import os
+
+
+AUDIO_DIR = os.path.join('resources', 'audio')
+BUILTIN_SONGS = ('default', 'bell', 'calm', 'police', 'reload')
+VOICES = 3  # Сколько раз одна мелодия может звучать одновременно
+MAX_CUSTOM_SONGS = 8  # Сколько пользовательских мелодий держать в памяти
+
+
+class AudioEngine(QObject):
+    """Набор загруженных в память мелодий.
+       Для каждой мелодии есть несколько "голосов" (QSoundEffect),
+       поэтому одновременно пришедшие уведомления звучат вместе"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.songs = {song: self._load(os.path.join(AUDIO_DIR, song + '.wav'))
+                      for song in BUILTIN_SONGS}
+        # Пользовательские мелодии (пути к wav файлам).
+        # Давно не звучавшие вытесняются, когда их становится больше MAX_CUSTOM_SONGS
+        self.custom_songs = OrderedDict()
+
+    def _load(self, path):
+        voices = []
+        url = QUrl.fromLocalFile(os.path.abspath(path))
+        for _ in range(VOICES):
+            effect = QSoundEffect(self)
+            effect.setSource(url)
+            voices.append(effect)
+        return voices
+
+    def voices(self, song):
+        """Возвращает голоса мелодии: встроенной (по названию)
+           или пользовательской (по пути к wav файлу)"""
+        if song in self.songs:
+            return self.songs[song]
+        if song in self.custom_songs:
+            self.custom_songs.move_to_end(song)
+            return self.custom_songs[song]
+        voices = self.custom_songs[song] = self._load(song)
+        if len(self.custom_songs) > MAX_CUSTOM_SONGS:
+            _, evicted = self.custom_songs.popitem(last=False)
+            for effect in evicted:
+                effect.stop()
+                effect.deleteLater()
+        return voices
+
+    def play(self, song):
+        """Воспроизводит мелодию и возвращает звучащий голос(чтобы его можно было
+           остановить), либо None, если мелодия не задана"""
+        if song in (None, 'None'):
+            return None
+        voices = self.voices(song)
+        # Берётся свободный голос, а если все заняты - тот, что звучит дольше всех
+        effect = next((effect for effect in voices if not effect.isPlaying()), voices[0])
+        voices.remove(effect)
+        voices.append(effect)
+        effect.stop()
+        effect.play()
+        return effect
+
+
+_engine = None
+
+
+def get_audio_engine():
+    """Возвращает общий для процесса набор мелодий
+       (создать его можно только после создания QApplication)"""
+    global _engine
+    if _engine is None:
+        _engine = AudioEngine()
+    return _engine
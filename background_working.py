@@ -1,57 +1,425 @@
-from threading import Thread
+from threading import Thread, Lock
+from core import (load_notifys, notifications_from_rows, load_snoozes, deliver_group,
+                  NotificationError, Snooze)
+from scheduler import Scheduler
+from recurrence import next_times, clock_epoch
+from ipc import Server, send, ChannelError, DAEMON_PORT, NOTIFIER_PORT
+from storage import get_database, close_database, DB_PATH
+from metrics import get_metrics, start_dumping
 from time import sleep
-from Noty import (load_notifys,
-                  NotificationError)
+from functools import partial
+import argparse
 import datetime as dt
+import json
 import os
+import sqlite3
+import sys
 
 
-def check_file():
-    """Эта функция служит для того чтобы завершать работу
-       этого фонового модуля, когда запускается основной модуль Noty"""
-    while True:
+WATCH_INTERVAL = 1  # Как часто проверять, не изменилась ли база данных (в секундах)
+# Если изменилось больше напоминаний, все напоминания перечитываются целиком
+RELOAD_THRESHOLD = 10000
+
+
+def profile_path(path):
+    """Путь к базе данных профиля в едином виде: по нему профили различаются,
+       поэтому один и тот же профиль не может быть добавлен дважды
+       под разными путями"""
+    return os.path.realpath(path)
+
+
+class Profile:
+    """Профиль - отдельная база данных напоминаний со своим процессом notify.
+       Фоновый модуль обслуживает сразу много профилей"""
+
+    def __init__(self, path, notifier_port=NOTIFIER_PORT, paused=False):
+        self.path = path
+        self.notifier_port = notifier_port  # Порт процесса notify, показывающего уведомления
+        # Приостановлен ли профиль: напоминания профиля присылает открытый основной модуль
+        self.paused = paused
+        self.notifys = None  # Напоминания: "id: Notification"(None - ещё не загружены)
+        self.last_change = 0  # Номер последней учтённой записи журнала изменений
+        self.data_version = None
+        self.snoozes = {}  # Отложенные уведомления: "id: Snooze"
+        # id присланных отложенных уведомлений, которые, возможно, ещё есть в базе
+        # данных: их удаляют только после того, как процесс notify их принял,
+        # и перечитывание базы не должно поставить их в очередь снова
+        self.delivered_snoozes = set()
+
+    def describe(self):
+        return {'profile': self.path, 'notifier_port': self.notifier_port,
+                'paused': self.paused,
+                'notifications': 0 if self.notifys is None else len(self.notifys),
+                'snoozes': len(self.snoozes)}
+
+
+class BackgroundWorker:
+    """Отвечает за отправку уведомлений, когда основной модуль закрыт.
+       Процесс не завершается при открытии основного модуля,
+       а лишь приостанавливается по команде из управляющего канала.
+       Отложенные уведомления присылает только фоновый модуль,
+       в том числе и когда он приостановлен.
+       Изменения базы данных (из основного модуля или при импорте)
+       подхватываются сами: фоновый модуль раз в секунду проверяет
+       PRAGMA data_version и перечитывает по журналу изменений
+       только изменившиеся напоминания.
+       Один процесс обслуживает любое число профилей: напоминания всех профилей
+       стоят в одной очереди планировщика парами (профиль, напоминание),
+       поэтому на все профили приходится один поток планировщика
+       и один поток, следящий за базами данных"""
+
+    def __init__(self):
+        self.scheduler = Scheduler()
+        self.profiles = {}  # Обслуживаемые профили: "путь к базе данных: Profile"
+        # Блокировка не даёт отправить напоминание в момент передачи управления
+        self.lock = Lock()
+
+    def handle_command(self, message):
+        """Обрабатывает команду, пришедшую через управляющий канал.
+           Команды, относящиеся к профилю, берут путь к его базе данных из поля
+           profile (по умолчанию - профиль основного модуля)"""
+        command = message.get('command')
+        path = profile_path(message.get('profile', DB_PATH))
+        if command == 'pause':
+            self.pause(self.known_profile(path))
+        elif command == 'resume':
+            self.resume(self.known_profile(path))
+        elif command == 'snooze':
+            self.snooze(self.known_profile(path), message)
+        elif command == 'add_profile':
+            # Через канал можно добавить только уже существующую базу данных:
+            # создавать новые файлы по чужой команде фоновый модуль не должен
+            if not os.path.isfile(path):
+                raise ValueError(f'База данных профиля не найдена: {path}')
+            self.add_profile(path, message.get('notifier_port', NOTIFIER_PORT))
+        elif command == 'remove_profile':
+            self.remove_profile(path)
+        elif command == 'profiles':
+            with self.lock:
+                return {'profiles': [profile.describe() for profile in self.profiles.values()]}
+        elif command == 'metrics':
+            return {'profiles': len(self.profiles), 'metrics': get_metrics().snapshot()}
+        elif command != 'ping':
+            raise ValueError(f'Неизвестная команда: {command}')
+        profile = self.profiles.get(path)
+        return {'paused': profile.paused if profile is not None else None}
+
+    def known_profile(self, path):
+        """Возвращает обслуживаемый профиль, либо вызывает ValueError.
+           Профиль основного модуля добавляется сам, при первой команде от него"""
+        with self.lock:
+            profile = self.profiles.get(path)
+        if profile is not None:
+            return profile
+        if path == profile_path(DB_PATH):
+            return self.get_profile(path)
+        raise ValueError(f'Профиль не обслуживается: {path}')
+
+    def get_profile(self, path, paused=True):
+        """Возвращает профиль, при необходимости добавляя его
+           (новый профиль приостановлен, если paused)"""
+        path = profile_path(path)
+        with self.lock:
+            profile = self.profiles.get(path)
+        if profile is not None:
+            return profile
+        # Профиль регистрируется, только когда его база данных открылась:
+        # иначе команда вернула бы ошибку, а сломанный профиль остался бы в списке
+        get_database(path)
+        profile = Profile(path, paused=paused)
+        with self.lock:
+            self.profiles[path] = profile
+        try:
+            self.load_snoozes(profile)
+        except sqlite3.Error:
+            self.remove_profile(path)
+            raise
+        return profile
+
+    def add_profile(self, path, notifier_port=NOTIFIER_PORT):
+        """Начинает обслуживать профиль: загружает его напоминания
+           и ставит их в очередь"""
+        added = profile_path(path) not in self.profiles
+        profile = self.get_profile(path)
+        profile.notifier_port = notifier_port
         try:
-            with open('state.txt', 'r', encoding='utf-8') as f:
-                state = f.read()
-                if state == 'working':
-                    os._exit(0)
-        except FileNotFoundError:
-            with open('state.txt', 'r', encoding='utf-8') as f:
-                f.write('closed')
-        sleep(1)
-
-
-def background_work(notifys):
-    """Эта функция отвечает за отправку уведомлений
-       когда основной модуль закрыт"""
-    notifys_times = {}
-    # В этом словаре будут храниться пары "время напоминания: напоминание"
-    for notify in notifys:
+            self.resume(profile)
+        except sqlite3.Error:
+            if added:
+                self.remove_profile(profile.path)
+            raise
+        return profile
+
+    def remove_profile(self, path):
+        """Перестаёт обслуживать профиль и закрывает его базу данных"""
+        path = profile_path(path)
+        with self.lock:
+            profile = self.profiles.pop(path, None)
+            if profile is None:
+                return
+            self.discard_all(profile)
+            for snooze in profile.snoozes.values():
+                self.scheduler.discard((profile, snooze))
+        close_database(path)
+
+    def schedule(self, profile, notify, after=None):
+        """Ставит напоминание профиля в очередь на ближайшее время прихода
+           (после after, см. Notification.next_time)"""
         try:
-            notifys_times[notify.next_time()] = notify
+            self.scheduler.schedule((profile, notify), notify.next_time(after))
         except NotificationError:
-            continue
-    while True:
-        # Основной цикл фонового модуля.
-        # Постоянно проверяет текущее время,
-        # и когда видит что на это время(+-5 секунд) назначено напоминание -
-        # присылает его
-        current_time = dt.datetime.now()
-        arrive_notifys = [time for time in notifys_times.keys() if (time - current_time).total_seconds() <= 5]
-        for time in arrive_notifys:
-            notify = notifys_times[time]
-            notify.notify()
-            try:
-                notifys_times[notify.next_time()] = notify
-            except NotificationError:
-                pass
-            del notifys_times[time]
-        sleep(5)
+            self.scheduler.discard((profile, notify))
+
+    def discard_all(self, profile):
+        """Убирает из очереди все напоминания профиля (кроме отложенных)"""
+        for notify in (profile.notifys or {}).values():
+            self.scheduler.discard((profile, notify))
+
+    def pause(self, profile):
+        """Основной модуль открыт и берёт отправку напоминаний профиля на себя"""
+        with self.lock:
+            profile.paused = True
+            self.discard_all(profile)
+
+    def load_snoozes(self, profile):
+        """Подгружает из базы данных отложенные уведомления
+           (в том числе сохранённые туда, пока фоновый модуль не работал)"""
+        snoozes = load_snoozes(profile.path)
+        with self.lock:
+            # Уведомления, которых в базе уже нет, пропускать больше не нужно
+            profile.delivered_snoozes &= {snooze.id for snooze in snoozes}
+            for snooze in snoozes:
+                if snooze.id not in profile.snoozes and \
+                        snooze.id not in profile.delivered_snoozes:
+                    profile.snoozes[snooze.id] = snooze
+                    self.schedule(profile, snooze)
+
+    def snooze(self, profile, message):
+        """Откладывает уведомление профиля: сохраняет его в базу данных
+           и ставит в очередь"""
+        fire_at = dt.datetime.now() + dt.timedelta(minutes=message['minutes'])
+        id_ = get_database(profile.path).add_snooze(message['notification_id'],
+                                                    message['title'], message['text'],
+                                                    message['song'], fire_at)
+        snooze = Snooze(id_, message['notification_id'], message['title'],
+                        message['text'], message['song'], fire_at, profile.path)
+        with self.lock:
+            # id удалённого уведомления могло достаться новому
+            profile.delivered_snoozes.discard(id_)
+            profile.snoozes[id_] = snooze
+            self.schedule(profile, snooze)
+
+    def resume(self, profile):
+        """Основной модуль закрыт: из только что сохранённой базы данных
+           перечитываются изменённые напоминания профиля (при первом запуске - все),
+           и фоновый модуль продолжает их присылать"""
+        if profile.notifys is None:
+            self.reload(profile)
+        else:
+            self.apply_changes(profile)
+        epoch = clock_epoch(dt.datetime.now())
+        with self.lock:
+            notifys = list(profile.notifys.values())
+            for notify, time in zip(notifys, next_times(notifys)):
+                notify.remember_next_time(time, epoch)
+                if time is not None:
+                    self.scheduler.schedule((profile, notify), time)
+            profile.paused = False
+        self.load_snoozes(profile)
+
+    def reload(self, profile):
+        """Перечитывает все напоминания профиля из базы данных"""
+        database = get_database(profile.path)
+        # Номер записи журнала берётся до чтения: изменения, сделанные
+        # во время чтения, будут перечитаны ещё раз, но не потеряются
+        last_change = database.last_change()
+        notifys = {notify.id: notify for notify in load_notifys(profile.path)}
+        with self.lock:
+            self.discard_all(profile)
+            profile.notifys = notifys
+            profile.last_change = last_change
+            if not profile.paused:
+                for notify in notifys.values():
+                    self.schedule(profile, notify)
+        database.trim_changes(last_change)
+        get_metrics().increment('full_reloads')
+
+    def apply_changes(self, profile):
+        """Перечитывает из базы данных только напоминания профиля, изменившиеся
+           с прошлой проверки, и заменяет их в очереди планировщика"""
+        if profile.notifys is None:
+            # Напоминания ещё не загружены - их загрузит resume
+            return
+        database = get_database(profile.path)
+        last_change, ids = database.changes_since(profile.last_change)
+        if len(ids) > RELOAD_THRESHOLD:
+            self.reload(profile)
+            return
+        changed = notifications_from_rows(database.load_by_ids(ids), profile.path) \
+            if ids else []
+        with self.lock:
+            for id_ in ids:
+                notify = profile.notifys.pop(id_, None)
+                if notify is not None:
+                    self.scheduler.discard((profile, notify))
+            for notify in changed:
+                profile.notifys[notify.id] = notify
+                if not profile.paused:
+                    self.schedule(profile, notify)
+            profile.last_change = last_change
+        if ids:
+            database.trim_changes(last_change)
+            get_metrics().increment('reloaded_notifications', len(ids))
+
+    def watch(self):
+        """Раз в WATCH_INTERVAL секунд проверяет, не изменил ли базы данных
+           профилей другой процесс, и если изменил - подхватывает изменения"""
+        while True:
+            with self.lock:
+                profiles = list(self.profiles.values())
+            for profile in profiles:
+                if self.profiles.get(profile.path) is not profile:
+                    # Профиль удалили, и его база данных уже закрыта
+                    continue
+                try:
+                    data_version = get_database(profile.path).data_version()
+                    if data_version != profile.data_version:
+                        self.apply_changes(profile)
+                        # Отложенные уведомления тоже могли добавиться в базу напрямую
+                        self.load_snoozes(profile)
+                        # Версия запоминается только после успешного перечитывания,
+                        # иначе изменения перечитаются при следующей проверке
+                        profile.data_version = data_version
+                except sqlite3.Error:
+                    # Например, база данных занята дольше busy_timeout, повреждена
+                    # или уже закрыта (профиль удалили). Остальные профили
+                    # всё равно проверяются, а этот - снова через WATCH_INTERVAL
+                    get_metrics().increment('watch_errors')
+            sleep(WATCH_INTERVAL)
+
+    def deliver(self, due):
+        # Планировщик будит поток ко времени напоминания и отдаёт все
+        # наступившие напоминания разом: напоминания одного профиля
+        # присылаются одним уведомлением его процессу notify.
+        # После отправки напоминания ставятся в очередь на следующий раз
+        with self.lock:
+            groups = {}  # "профиль: список пар (время прихода, напоминание)"
+            for time, (profile, notify) in due:
+                if self.profiles.get(profile.path) is not profile:
+                    # Профиль успели удалить
+                    continue
+                if isinstance(notify, Snooze):
+                    del profile.snoozes[notify.id]
+                    notify.delivered = True
+                    profile.delivered_snoozes.add(notify.id)
+                elif profile.paused:
+                    # Напоминание пришлёт основной модуль
+                    get_metrics().increment('skipped_paused')
+                    continue
+                elif profile.notifys.get(notify.id) is not notify:
+                    # Напоминание успели изменить или удалить, пока оно приходило
+                    continue
+                groups.setdefault(profile, []).append((time, notify))
+            for profile, group in groups.items():
+                snooze_ids = [notify.id for _, notify in group if isinstance(notify, Snooze)]
+                done = partial(self.snoozes_sent, profile, snooze_ids) if snooze_ids else None
+                try:
+                    deliver_group(group, profile.path, profile.notifier_port, done)
+                except Exception:
+                    # Например, текст напоминания не прочитать из занятой базы данных.
+                    # Остальные профили всё равно получают свои напоминания
+                    get_metrics().increment('delivery_errors')
+                    # Отложенные уведомления не отправлены и остаются в базе данных
+                    profile.delivered_snoozes.difference_update(snooze_ids)
+                finally:
+                    for time, notify in group:
+                        self.schedule(profile, notify, time)
+
+    def retry(self, time, item):
+        """Снова ставит в очередь напоминание из пачки, которую не удалось
+           прислать (см. Scheduler.run): повторяющееся напоминание придёт
+           в следующий раз, а не замолчит до перечитывания базы данных"""
+        profile, notify = item
+        if isinstance(notify, Snooze):
+            # Отложенное уведомление осталось в базе данных: если его не успели
+            # отправить, его снова поставит в очередь следующее перечитывание
+            # отложенных уведомлений, а отправленное удалит snoozes_sent
+            with self.lock:
+                if not notify.delivered and profile.snoozes.get(notify.id) is notify:
+                    del profile.snoozes[notify.id]
+            return
+        with self.lock:
+            if profile.notifys is not None and profile.notifys.get(notify.id) is notify \
+                    and not profile.paused:
+                self.schedule(profile, notify, time)
+
+    def snoozes_sent(self, profile, ids, sent):
+        """Вызывается после отправки отложенных уведомлений профиля процессу notify.
+           Принятые уведомления удаляются из базы данных, а не принятые остаются
+           в ней и будут присланы снова, когда база данных будет перечитана"""
+        if self.profiles.get(profile.path) is not profile:
+            # Профиль успели удалить, и его база данных закрыта
+            return
+        if sent:
+            get_database(profile.path).delete_snoozes(ids)
+        else:
+            with self.lock:
+                profile.delivered_snoozes.difference_update(ids)
+
+    def start(self):
+        """Запускает поток, присылающий напоминания,
+           и поток, следящий за изменениями баз данных"""
+        Thread(target=self.scheduler.run, args=[self.deliver, self.retry], daemon=True).start()
+        Thread(target=self.watch, daemon=True).start()
+
+
+def parse_profiles(args):
+    """Профили из аргументов командной строки: список пар (путь, порт notify)"""
+    profiles = [(path, NOTIFIER_PORT) for path in args.profile]
+    if args.profiles:
+        # json файл со списком объектов {"path": ..., "notifier_port": ...}
+        with open(args.profiles, 'r', encoding='utf-8') as profiles_file:
+            profiles += [(profile['path'], profile.get('notifier_port', NOTIFIER_PORT))
+                         for profile in json.load(profiles_file)]
+    return [(profile_path(path), notifier_port)
+            for path, notifier_port in profiles or [(DB_PATH, NOTIFIER_PORT)]]
 
 
 if __name__ == '__main__':
-    # Подгрузка напоминаний
-    notifications = load_notifys()
-    # Запуск потока, присылающего напоминания
-    Thread(target=background_work, args=[notifications]).start()
-    check_file()
+    parser = argparse.ArgumentParser()
+    # С аргументом --paused фоновый модуль запускается основным модулем
+    # и до его закрытия присылает только отложенные уведомления
+    parser.add_argument('--paused', action='store_true')
+    parser.add_argument('--profile', action='append', default=[],
+                        help='путь к базе данных профиля (можно указать несколько раз)')
+    parser.add_argument('--profiles', help='json файл со списком профилей')
+    args = parser.parse_args()
+    profiles = parse_profiles(args)
+    worker = BackgroundWorker()
+    try:
+        server = Server(DAEMON_PORT, worker.handle_command)
+    except OSError:
+        # Фоновый модуль уже запущен: просто просим его обслуживать
+        # эти профили и продолжить работу
+        for path, notifier_port in profiles:
+            if path != profile_path(DB_PATH):
+                try:
+                    send(DAEMON_PORT, {'command': 'add_profile', 'profile': path,
+                                       'notifier_port': notifier_port})
+                except ChannelError as error:
+                    # Например, базы данных профиля нет
+                    print(error, file=sys.stderr)
+        if not args.paused:
+            try:
+                send(DAEMON_PORT, {'command': 'resume'})
+            except ChannelError:
+                pass
+        sys.exit(0)
+    for path, notifier_port in profiles:
+        if args.paused and path == profile_path(DB_PATH):
+            worker.get_profile(path).notifier_port = notifier_port
+        else:
+            worker.add_profile(path, notifier_port)
+    start_dumping('background')
+    worker.start()
+    server.serve_forever()
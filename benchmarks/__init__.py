@@ -0,0 +1,3 @@
+"""Замеры скорости и памяти основных частей приложения на больших объёмах данных.
+
+   Запуск из папки проекта: python -m benchmarks --sizes 1000 100000"""
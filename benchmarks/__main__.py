@@ -0,0 +1,227 @@
+"""Запуск замеров: python -m benchmarks [--sizes 1000 100000 1000000] [--output файл]
+
+   Для каждого размера создаётся синтетическая база данных во временной папке,
+   и все замеры выполняются в ней без вывода окон на экран (Qt offscreen).
+   Результаты (время и пиковая память) записываются в json файл, чтобы
+   их можно было сравнивать между коммитами"""
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # Модуля resource нет в Windows
+    resource = None
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from benchmarks.generate import generate_database  # noqa: E402
+
+
+CASES = {}  # Замеры: "название: функция"
+
+
+def case(name):
+    """Регистрирует замер. Функция замера получает размер базы, сама
+       готовит всё нужное и возвращает функцию, выполнение которой и замеряется"""
+    def decorator(function):
+        CASES[name] = function
+        return function
+    return decorator
+
+
+@case('load_notifys')
+def bench_load(size):
+    from core import load_notifys
+    import storage
+    storage.get_database().close()  # Соединение тоже открывается заново
+    return load_notifys
+
+
+@case('save_notifys')
+def bench_save(size):
+    window = main_window()
+    # Изменяется 1% напоминаний
+    for notify in window.notifys[::100]:
+        notify.title = notify.title + '!'
+    return window.save_notifys
+
+
+@case('next_time')
+def bench_next_time(size):
+    from core import load_notifys, NotificationError
+
+    notifys = load_notifys()
+
+    def run():
+        for notify in notifys:
+            try:
+                notify.next_time()
+            except NotificationError:
+                pass
+    return run
+
+
+@case('next_times')
+def bench_next_times(size):
+    from core import load_notifys
+    from recurrence import next_times
+    notifys = load_notifys()
+    return lambda: next_times(notifys)
+
+
+@case('upcoming')
+def bench_upcoming(size):
+    # Первая тысяча приходов напоминаний на неделю вперёд (как в окне "7 дней")
+    import itertools
+    from core import load_notifys, upcoming
+    notifys = load_notifys()
+
+    def run():
+        end = dt.datetime.now() + dt.timedelta(days=7)
+        return {'occurrences': sum(1 for _ in itertools.islice(upcoming(notifys, None, end),
+                                                               1000))}
+    return run
+
+
+@case('background_resume')
+def bench_background_resume(size):
+    # Одна итерация фонового модуля: перечитать базу и построить расписание
+    from background_working import BackgroundWorker, Profile
+    from storage import DB_PATH
+    return lambda: BackgroundWorker().resume(Profile(DB_PATH))
+
+
+@case('daemon_startup')
+def bench_daemon_startup(size):
+    # Запуск отдельного интерпретатора, импортирующего фоновый модуль.
+    # Кроме времени записывается и пиковый объём памяти процесса
+    # (там, где есть /proc). ru_maxrss здесь не годится: в Linux он наследуется
+    # через fork/exec и показал бы пик самого процесса бенчмарков
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [project_dir, environment.get('PYTHONPATH')]))
+    script = ('import background_working\n'
+              'peak = -1\n'
+              'try:\n'
+              '    with open("/proc/self/status") as status:\n'
+              '        for line in status:\n'
+              '            if line.startswith("VmHWM:"):\n'
+              '                peak = int(line.split()[1])\n'
+              'except OSError:\n'
+              '    pass\n'
+              'print(peak)\n')
+
+    def run():
+        output = subprocess.run([sys.executable, '-c', script], env=environment,
+                                capture_output=True, text=True, check=True).stdout
+        max_rss = int(output.split()[-1])
+        return {'max_rss_kib': max_rss} if max_rss >= 0 else {}
+    return run
+
+
+@case('show_notifys')
+def bench_show_notifys(size):
+    from PyQt5.QtWidgets import QApplication
+    import Noty
+
+    def run():
+        window = Noty.MainWindow()
+        window.show()
+        QApplication.processEvents()
+        # Окно прячется, а не закрывается: закрытие сохранило бы базу
+        # и передало бы работу фоновому модулю
+        window.hide()
+        window.deleteLater()
+    application()
+    return run
+
+
+_application = None
+
+
+def application():
+    global _application
+    from PyQt5.QtWidgets import QApplication
+    if _application is None:
+        _application = QApplication.instance() or QApplication(sys.argv[:1])
+    return _application
+
+
+def main_window():
+    import Noty
+    application()
+    return Noty.MainWindow()
+
+
+def measure(name, size):
+    """Выполняет замер дважды: сначала время, потом память (tracemalloc замедляет код)"""
+    run = CASES[name](size)
+    start = time.perf_counter()
+    returned = run()
+    seconds = time.perf_counter() - start
+    # Замер может вернуть словарь с дополнительными результатами
+    extra = returned if isinstance(returned, dict) else {}
+    run = CASES[name](size)
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return dict({'case': name, 'size': size, 'seconds': seconds, 'peak_bytes': peak}, **extra)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000])
+    parser.add_argument('--cases', nargs='+', choices=sorted(CASES), default=list(CASES))
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+    report = {'revision': git_revision(), 'python': platform.python_version(),
+              'platform': platform.platform(), 'date': dt.datetime.now().isoformat(),
+              'results': []}
+    project_dir = os.getcwd()
+    for size in args.sizes:
+        work_dir = tempfile.mkdtemp(prefix='noty-bench-')
+        try:
+            os.makedirs(os.path.join(work_dir, 'database'))
+            generate_database(os.path.join(work_dir, 'database', 'notifications_db.db'), size)
+            # Приложение открывает базу по относительному пути
+            os.chdir(work_dir)
+            for name in args.cases:
+                result = measure(name, size)
+                report['results'].append(result)
+                print(f"{name:>20} {size:>9} {result['seconds']:10.4f} s "
+                      f"{result['peak_bytes'] / 2 ** 20:10.1f} MiB", flush=True)
+        finally:
+            os.chdir(project_dir)
+            import storage
+            for database in list(storage._databases.values()):
+                database.close()
+            shutil.rmtree(work_dir, ignore_errors=True)
+    if resource is not None:
+        report['max_rss_kib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with open(output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
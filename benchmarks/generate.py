@@ -0,0 +1,57 @@
+"""Генерация синтетических баз данных напоминаний"""
+import datetime as dt
+import random
+import storage
+
+
+TITLES = ('Завтрак', 'Обед', 'Ужин', 'Выгулять собаку', 'Сходить в магазин',
+          'Позвонить маме', 'Тренировка', 'Принять лекарство', 'Полить цветы', 'Созвон')
+SONGS = ('default', 'bell', 'calm', 'police', 'reload')
+BATCH = 10000  # Сколько напоминаний записывать одной транзакцией
+
+
+def random_notification(rng, today):
+    """Возвращает поля случайного напоминания и список его дат.
+       Смесь режимов повтора примерно как у живого пользователя:
+       половина по дням недели, треть одноразовых, остальные по датам"""
+    kind = rng.random()
+    if kind < 0.5:
+        mode = 1
+    elif kind < 0.8:
+        mode = 0
+    else:
+        mode = 2
+    time = dt.datetime.combine(today + dt.timedelta(rng.randrange(-30, 30)),
+                               dt.time(rng.randrange(24), rng.randrange(0, 60, 5)))
+    week_mask = rng.randrange(1, 128) if mode == 1 else storage.ALL_WEEK_DAYS
+    dates = []
+    if mode == 2:
+        first = today.toordinal() - 30
+        dates = sorted(rng.sample(range(first, first + 365), rng.randint(1, 10)))
+    text = ' '.join(rng.choice(TITLES) for _ in range(rng.randrange(0, 30)))
+    row = (storage.format_time(time), rng.choice(TITLES), text, rng.random() < 0.9,
+           week_mask, mode, rng.choice(SONGS))
+    return row, dates
+
+
+def generate_database(path, count, seed=0):
+    """Создаёт базу данных path с count случайными напоминаниями"""
+    rng = random.Random(seed)
+    today = dt.date.today()
+    database = storage.Database(path)
+    connection = database.connection
+    for start in range(0, count, BATCH):
+        size = min(BATCH, count - start)
+        rows = []
+        dates = []
+        for id_ in range(start + 1, start + size + 1):
+            row, notify_dates = random_notification(rng, today)
+            rows.append((id_,) + row)
+            dates.extend((id_, ordinal) for ordinal in notify_dates)
+        with connection:
+            connection.executemany('''INSERT INTO notifications
+                                      (id, datetime, title, text, included,
+                                       week_days, repeating_mode, song)
+                                      VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+            connection.executemany(storage.INSERT_DATE, dates)
+    database.close()
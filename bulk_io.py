@@ -0,0 +1,127 @@
+"""Импорт и экспорт напоминаний без запуска интерфейса.
+
+   python Noty.py import файл [--database путь]
+   python Noty.py export файл [--database путь]
+
+   Формат файла определяется по расширению: .csv - таблица с заголовком,
+   .jsonl - по одному json объекту на строку. Файлы читаются и пишутся
+   построчно, поэтому память не зависит от числа напоминаний.
+   При импорте каждое напоминание проверяется по тем же правилам,
+   что и в окне редактирования, неверные строки пропускаются."""
+import argparse
+import csv
+import datetime as dt
+import json
+import sys
+from storage import get_database, DB_PATH, ALL_WEEK_DAYS
+from validation import validate_notification, ValidationError
+
+
+FIELDS = ('time', 'title', 'text', 'included', 'week_mask', 'repeating_mode', 'song', 'dates')
+
+
+def parse_record(record):
+    """Словарь с полями напоминания (как в файле) или строка jsonl файла ->
+       строка для Database.import_rows.
+       Вызывает ValidationError, если напоминание заполнено неверно"""
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except ValueError:
+            raise ValidationError('record', 'Строка не является json')
+    if not isinstance(record, dict):
+        raise ValidationError('record', 'Строка не является json объектом')
+    try:
+        time = dt.datetime.fromisoformat(record['time'])
+    except (KeyError, TypeError, ValueError):
+        raise ValidationError('time', f'Неверное время: {record.get("time")}')
+    title = str(record.get('title') or '')
+    text = str(record.get('text') or '')
+    included = record.get('included', True)
+    if isinstance(included, str):
+        included = included.strip().lower() not in ('0', 'false', 'no', '')
+    try:
+        week_mask = int(record.get('week_mask', ALL_WEEK_DAYS))
+        repeating_mode = int(record.get('repeating_mode', 0))
+    except (TypeError, ValueError):
+        raise ValidationError('repeating_mode', 'Маска дней недели и режим повтора - числа')
+    if not 0 <= week_mask <= ALL_WEEK_DAYS:
+        raise ValidationError('week_days', f'Неверная маска дней недели: {week_mask}')
+    dates = record.get('dates') or []
+    if isinstance(dates, str):
+        dates = dates.split()
+    try:
+        date_ordinals = sorted({dt.date.fromisoformat(date).toordinal() for date in dates})
+    except (TypeError, ValueError):
+        raise ValidationError('dates', f'Неверные даты: {dates}')
+    song = record.get('song', 'default')
+    if song in ('', 'None'):
+        song = None  # Без мелодии (база данных хранит такую мелодию как 'None')
+    validate_notification(title, repeating_mode, week_mask, date_ordinals)
+    return time, title, text, bool(included), week_mask, repeating_mode, song, date_ordinals
+
+
+def read_records(path):
+    """Построчно читает записи с напоминаниями: словари из csv файла
+       или строки jsonl файла (их разбирает parse_record, чтобы неверная
+       строка пропускалась, а не прерывала импорт)"""
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        if path.endswith('.csv'):
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield line
+
+
+def import_file(path, database_path=DB_PATH, errors=sys.stderr):
+    """Добавляет в базу напоминания из файла. Описания неверных строк
+       пишутся в errors. Возвращает число добавленных напоминаний"""
+
+    def rows():
+        for number, record in enumerate(read_records(path), 1):
+            try:
+                yield parse_record(record)
+            except ValidationError as error:
+                print(f'{path}:{number}: {error}', file=errors)
+
+    return get_database(database_path).import_rows(rows())
+
+
+def export_file(path, database_path=DB_PATH):
+    """Записывает все напоминания из базы в файл. Возвращает их число"""
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        if path.endswith('.csv'):
+            writer = csv.writer(file)
+            writer.writerow(FIELDS)
+        for _, time, title, text, included, week_mask, repeating_mode, song, date_ordinals \
+                in get_database(database_path).export():
+            dates = [dt.date.fromordinal(ordinal).isoformat() for ordinal in date_ordinals]
+            if path.endswith('.csv'):
+                writer.writerow((time, title, text, int(included), week_mask,
+                                 repeating_mode, song, ' '.join(dates)))
+            else:
+                file.write(json.dumps(dict(zip(FIELDS, (time, title, text, included, week_mask,
+                                                        repeating_mode, song, dates))),
+                                      ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog='Noty.py')
+    parser.add_argument('action', choices=('import', 'export'))
+    parser.add_argument('path', help='csv или jsonl файл')
+    parser.add_argument('--database', default=DB_PATH)
+    args = parser.parse_args(args)
+    if args.action == 'import':
+        count = import_file(args.path, args.database)
+        print(f'Импортировано напоминаний: {count}')
+    else:
+        count = export_file(args.path, args.database)
+        print(f'Экспортировано напоминаний: {count}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,269 @@
+"""Модель напоминаний: напоминания, отложенные уведомления, их загрузка
+   из базы данных и отправка.
+
+   Модуль не зависит от PyQt5: его импортирует фоновый модуль, которому
+   интерфейс не нужен, поэтому он быстро запускается и занимает мало памяти.
+   Окна приложения находятся в модулях Noty и notify"""
+import datetime as dt
+import heapq
+import sys
+from array import array
+from recurrence import next_fire, next_times, occurrences, clock_epoch
+import storage
+from notify_client import alert, show_notifications
+from ipc import NOTIFIER_PORT
+from metrics import get_metrics
+
+
+class NotificationError(Exception):
+    """Вызывается только из класса напоминания, если возникли какие-то проблемы"""
+    pass
+
+
+class Notification:
+    # Напоминаний могут быть десятки тысяч, поэтому они хранятся компактно:
+    # без __dict__, дни недели - битовой маской, даты - массивом чисел
+    # Тексты не хранятся вовсе: они читаются из базы данных, когда нужны (см. text)
+    __slots__ = ('id', 'dirty', 'time', 'title', 'loaded_text', 'included',
+                 'week_mask', 'date_ordinals', 'repeating_mode', 'song',
+                 'cache_epoch', 'cache_time', 'profile')
+
+    # Поля, которые хранятся в базе данных. Изменение любого из них
+    # помечает напоминание как изменённое(dirty), и при сохранении
+    # в базу данных перезаписываются только такие напоминания
+    PERSISTENT_FIELDS = frozenset(('time', 'title', 'text', 'included', 'week_mask',
+                                   'date_ordinals', 'repeating_mode', 'song'))
+    # Поля, от которых зависит время прихода. Изменение любого из них
+    # сбрасывает запомненное время прихода
+    SCHEDULE_FIELDS = frozenset(('time', 'included', 'week_mask',
+                                 'date_ordinals', 'repeating_mode'))
+
+    def __init__(self, time, title, text,
+                 included=True, week_days=None, month_dates=None,
+                 repeating_mode=0, song='default', id_=None,
+                 week_mask=storage.ALL_WEEK_DAYS, date_ordinals=(), profile=storage.DB_PATH):
+        # Дни недели и даты можно передать как списками(week_days и month_dates),
+        # так и сразу в компактном виде(week_mask и date_ordinals)
+        # Запомненное время прихода (None - не придёт никогда) и эпоха часов,
+        # в которую оно посчитано (-1 - время не посчитано), см. next_time
+        self.cache_epoch = -1
+        self.cache_time = None
+        self.id = id_  # Первичный ключ в базе данных(None, если напоминание ещё не сохранено)
+        self.profile = profile  # Путь к базе данных, в которой хранится напоминание
+        self.dirty = True  # Есть ли несохранённые изменения
+        self.time = time  # День, час и минута напоминания
+        self.title = title  # Заголовок
+        # Некоторое пояснение к оповещению. None - текст не загружен из базы данных
+        self.text = text
+        self.included = included  # Состояние оповезения: вкл/выкл(bool)
+        # Дни недели, в которые приходит напоминание(понедельник - младший бит)
+        self.week_mask = week_mask
+        if week_days is not None:
+            self.week_days = week_days
+        # Конкретные даты, в которые приходит напоминание(отсортированные date.toordinal())
+        self.date_ordinals = array('i', sorted(date_ordinals))
+        if month_dates is not None:
+            self.month_dates = month_dates
+        self.repeating_mode = repeating_mode
+        # Режим повтора. 0 - напоминание приходит 1 раз, после чего выключается
+        #                1 - напоминание приходит в определённые дни недели
+        #                2 - напоминание приходит в определённые даты,
+        #                установленные пользователем
+        # Мелодия напоминания. Мелодий всего несколько, поэтому
+        # одинаковые названия хранятся в памяти один раз
+        self.song = sys.intern(song) if isinstance(song, str) else song
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name in self.PERSISTENT_FIELDS:
+            super().__setattr__('dirty', True)
+            if name in self.SCHEDULE_FIELDS:
+                super().__setattr__('cache_epoch', -1)
+
+    @property
+    def text(self):
+        """Текст напоминания. Если он не загружен, то читается из базы данных"""
+        if self.loaded_text is None:
+            return '' if self.id is None else storage.get_database(self.profile).text(self.id)
+        return self.loaded_text
+
+    @text.setter
+    def text(self, text):
+        object.__setattr__(self, 'loaded_text', text)
+
+    def unload_text(self):
+        """Забывает текст сохранённого напоминания: когда он понадобится,
+           он будет прочитан из базы данных"""
+        if self.id is not None and not self.dirty:
+            object.__setattr__(self, 'loaded_text', None)
+
+    @property
+    def week_days(self):
+        """Дни недели, в которые приходит напоминание, списком из 7 bool"""
+        return storage.mask_to_week_days(self.week_mask)
+
+    @week_days.setter
+    def week_days(self, week_days):
+        self.week_mask = storage.week_days_to_mask(week_days)
+
+    @property
+    def month_dates(self):
+        """Конкретные даты, в которые приходит напоминание, списком datetime.date"""
+        return [dt.date.fromordinal(ordinal) for ordinal in self.date_ordinals]
+
+    @month_dates.setter
+    def month_dates(self, month_dates):
+        self.date_ordinals = array('i', sorted(date.toordinal() for date in month_dates))
+
+    def alert(self, scheduled=None, profile=None):
+        """Описание уведомления для процесса notify.
+           profile - путь к базе данных, из которой загружено напоминание
+           (по умолчанию - база данных самого напоминания)"""
+        profile = self.profile if profile is None else profile
+        return alert(self.title, self.text, self.song, self.id, scheduled, profile)
+
+    def next_time(self, after=None):
+        """Возвращает ближайшее время прихода напоминания,
+           либо вызывает NotificationError.
+           after - время только что пришедшего напоминания: планировщик присылает
+           напоминания из окна объединения чуть раньше срока, и следующее время
+           прихода должно быть позже after, а не только позже текущего момента"""
+        assert self.repeating_mode in (0, 1, 2), 'Нарушение инварианта для режима повторения'
+        if not self.included:
+            raise NotificationError('Оповещение отключено')
+        now = dt.datetime.now()
+        epoch = clock_epoch(now)
+        if after is not None and after > now:
+            now = after
+        # Запомненное время остаётся ближайшим, пока оно не наступило:
+        # раньше него напоминание прийти не может
+        if self.cache_epoch == epoch and (self.cache_time is None or self.cache_time > now):
+            get_metrics().increment('next_time_cache_hits')
+            time = self.cache_time
+        else:
+            get_metrics().increment('next_time_cache_misses')
+            time = next_fire(self.repeating_mode, self.time, self.week_mask,
+                             self.date_ordinals, now)
+            self.remember_next_time(time, epoch)
+        if time is None:
+            raise NotificationError('Время отправки оповещения уже прошло')
+        return time
+
+    def occurrences(self, start=None, end=None):
+        """Лениво перечисляет времена прихода напоминания после start
+           (по умолчанию - сейчас) и до end (None - без конца)"""
+        if not self.included:
+            return iter(())
+        start = dt.datetime.now() if start is None else start
+        return occurrences(self.repeating_mode, self.time, self.week_mask,
+                           self.date_ordinals, start, end)
+
+    def remember_next_time(self, time, epoch=None):
+        """Запоминает посчитанное время прихода (например, посчитанное
+           сразу для многих напоминаний функцией next_times)"""
+        if epoch is None:
+            epoch = clock_epoch(dt.datetime.now())
+        object.__setattr__(self, 'cache_time', time)
+        object.__setattr__(self, 'cache_epoch', epoch)
+
+    def forget_next_time(self):
+        """Сбрасывает запомненное время прихода (например, когда напоминание пришло)"""
+        object.__setattr__(self, 'cache_epoch', -1)
+
+
+class Snooze:
+    """Отложенное пользователем уведомление.
+       Приходит один раз, в момент fire_at, и хранится в базе данных,
+       пока не придёт, поэтому переживает перезапуск процессов приложения"""
+    __slots__ = ('id', 'notification_id', 'title', 'text', 'song', 'fire_at', 'delivered',
+                 'profile')
+
+    def __init__(self, id_, notification_id, title, text, song, fire_at,
+                 profile=storage.DB_PATH):
+        self.profile = profile  # Путь к базе данных, в которой хранится уведомление
+        self.id = id_
+        self.notification_id = notification_id  # id напоминания, которое было отложено
+        self.title = title
+        self.text = text
+        self.song = song
+        self.fire_at = fire_at
+        self.delivered = False
+
+    def alert(self, scheduled=None, profile=None):
+        """Описание уведомления для процесса notify. Из базы данных отложенное
+           уведомление удаляет тот, кто его прислал, и только когда
+           процесс notify его принял (см. BackgroundWorker.deliver)"""
+        return alert(self.title, self.text, self.song, self.notification_id, scheduled,
+                     self.profile)
+
+    def forget_next_time(self):
+        # Отложенное уведомление приходит один раз, и его время не запоминается
+        pass
+
+    def next_time(self, after=None):
+        if self.delivered:
+            raise NotificationError('Отложенное уведомление уже пришло')
+        return self.fire_at
+
+
+def deliver_group(due, profile=storage.DB_PATH, notifier_port=NOTIFIER_PORT, done=None):
+    """Присылает пачку одновременно наступивших напоминаний - пар
+       (время прихода, напоминание) - профиля profile одним уведомлением
+       процессу notify, слушающему порт notifier_port.
+       done - как в notify_client.show_notifications"""
+    metrics = get_metrics()
+    for time, notify in due:
+        metrics.record_lateness('delivery_lateness', time)
+        metrics.mark('deliveries')
+        notify.forget_next_time()
+    show_notifications([notify.alert(time, profile) for time, notify in due], notifier_port,
+                       done)
+
+
+def upcoming(notifys, start=None, end=None):
+    """Лениво перечисляет приходы всех напоминаний по возрастанию времени -
+       пары (время прихода, напоминание) - после start (по умолчанию - сейчас)
+       и до end (None - без конца). Приходы отдельных напоминаний сливаются
+       кучей: первые времена считаются сразу для всех напоминаний (next_times),
+       а следующее время напоминания - только когда его приход достали из кучи.
+       Поэтому первые k приходов n напоминаний достаются за O(n + k log n)"""
+    start = dt.datetime.now() if start is None else start
+    # Номер напоминания в куче не даёт сравнивать сами напоминания
+    heap = [(time, index, notify)
+            for index, (notify, time) in enumerate(zip(notifys, next_times(notifys, start)))
+            if time is not None and (end is None or time < end)]
+    heapq.heapify(heap)
+    while heap:
+        time, index, notify = heap[0]
+        yield time, notify
+        time = next_fire(notify.repeating_mode, notify.time, notify.week_mask,
+                         notify.date_ordinals, time)
+        if time is None or (end is not None and time >= end):
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (time, index, notify))
+
+
+def load_notifys(path=storage.DB_PATH):
+    """Загружает напоминания из базы данных sqlite"""
+    return notifications_from_rows(storage.get_database(path).load(), path)
+
+
+def notifications_from_rows(rows, path=storage.DB_PATH):
+    """Создаёт напоминания из строк, которые возвращает Database.load
+       из базы данных path"""
+    notifications = []
+    for time, title, text, included, week_mask, date_ordinals, repeating_mode, song, id_ \
+            in rows:
+        notify = Notification(time, title, text, included,
+                              repeating_mode=repeating_mode, song=song, id_=id_,
+                              week_mask=week_mask, date_ordinals=date_ordinals,
+                              profile=path)
+        notify.dirty = False
+        notifications.append(notify)
+    return notifications
+
+
+def load_snoozes(path=storage.DB_PATH):
+    """Загружает отложенные уведомления из базы данных"""
+    return [Snooze(*row, profile=path) for row in storage.get_database(path).load_snoozes()]
@@ -0,0 +1,70 @@
+"""История показов уведомлений: какие уведомления были показаны,
+   отложены или закрыты.
+
+   События копятся в памяти (get_history) и записываются в базу данных
+   профиля пачками, одной транзакцией на пачку: когда их набирается
+   BUFFER_SIZE, раз в FLUSH_INTERVAL секунд (start_flushing) и при выходе.
+   Как события хранятся и удаляются, см. Database.add_history."""
+from threading import Lock
+import datetime as dt
+import sqlite3
+from storage import get_database, DB_PATH
+from metrics import start_periodic
+
+
+SHOWN, SNOOZED, DISMISSED = 'shown', 'snoozed', 'dismissed'  # Виды событий
+BUFFER_SIZE = 100  # Сколько событий копить, прежде чем записать их в базу
+FLUSH_INTERVAL = 5  # Как часто записывать накопленные события (в секундах)
+
+
+class DeliveryHistory:
+    """Буфер событий истории. Методы можно вызывать из любого потока"""
+
+    def __init__(self, buffer_size=BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.lock = Lock()
+        self.events = []  # Ещё не записанные события: (профиль, событие для add_history)
+
+    def record(self, event, notification_id, title, profile=DB_PATH, time=None):
+        """Запоминает событие event уведомления. profile - путь к базе данных,
+           в которую оно будет записано"""
+        time = dt.datetime.now() if time is None else time
+        with self.lock:
+            self.events.append((profile, (time, event, notification_id, title)))
+            full = len(self.events) >= self.buffer_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Записывает накопленные события: по одной транзакции на профиль"""
+        with self.lock:
+            events, self.events = self.events, []
+        by_profile = {}
+        for profile, event in events:
+            by_profile.setdefault(profile, []).append(event)
+        for profile, profile_events in by_profile.items():
+            try:
+                get_database(profile).add_history(profile_events)
+            except sqlite3.Error:
+                # История не так важна, чтобы из-за неё мешать показу уведомлений
+                pass
+
+
+_history = DeliveryHistory()
+
+
+def get_history():
+    """Возвращает буфер истории текущего процесса"""
+    return _history
+
+
+def start_flushing(interval=FLUSH_INTERVAL):
+    """Запускает поток, записывающий накопленные события раз в interval секунд.
+       Возвращает событие, установка которого останавливает поток"""
+    return start_periodic(_history.flush, interval)
+
+
+def today(profile=DB_PATH):
+    """Записанные в базу события истории за сегодня по возрастанию времени"""
+    start = dt.datetime.combine(dt.date.today(), dt.time())
+    return get_database(profile).history(start, start + dt.timedelta(days=1))
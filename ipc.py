@@ -0,0 +1,161 @@
+"""Обмен сообщениями между процессами приложения через локальный сокет.
+
+   Каждое сообщение - это одна строка JSON, на которую сервер отвечает
+   тоже одной строкой JSON. Сервер слушает только 127.0.0.1, а занятый порт
+   служит блокировкой: второй экземпляр процесса запустить не получится.
+   К 127.0.0.1 могут подключиться и процессы других пользователей компьютера,
+   поэтому в каждом сообщении передаётся секрет пользователя (см. read_token),
+   и сообщения без него сервер отвергает"""
+import hmac
+import json
+import os
+import secrets
+import socket
+import threading
+
+
+HOST = '127.0.0.1'
+DAEMON_PORT = 48651  # Порт управляющего канала фонового модуля
+NOTIFIER_PORT = 48652  # Порт процесса, показывающего уведомления(notify --host)
+TIMEOUT = 2  # Сколько секунд ждать ответа
+# Файл с секретом пользователя. Он лежит в домашней папке и доступен только владельцу
+TOKEN_PATH = os.path.join(os.path.expanduser('~'), '.noty', 'ipc_token')
+
+
+class ChannelError(Exception):
+    """Вызывается, если процесс на другом конце канала недоступен
+       или ответил ошибкой"""
+    pass
+
+
+class NotRunningError(ChannelError):
+    """Вызывается, если к процессу не удалось даже подключиться, т. е. он не запущен.
+       В отличие от других ошибок канала, сообщение точно не было получено"""
+    pass
+
+
+_tokens = {}  # Прочитанные секреты: "путь к файлу: секрет"
+_tokens_lock = threading.Lock()
+
+
+def read_token(path=TOKEN_PATH):
+    """Возвращает секрет пользователя, которым процессы приложения
+       подтверждают друг другу, что запущены тем же пользователем.
+       При первом обращении секрет создаётся в файле, доступном только владельцу.
+       Файл читается один раз на процесс, а не при каждом сообщении"""
+    with _tokens_lock:
+        token = _tokens.get(path)
+        if token is None:
+            token = _tokens[path] = _load_token(path)
+        return token
+
+
+def _load_token(path):
+    try:
+        with open(path, 'r', encoding='ascii') as file:
+            token = file.read().strip()
+        if token:
+            return token
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    # Секрет сначала пишется во временный файл, а потом появляется под своим именем
+    # целиком. Если два процесса создают секрет одновременно, остаётся первый
+    temp_path = f'{path}.{os.getpid()}'
+    with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600),
+                   'w', encoding='ascii') as file:
+        file.write(secrets.token_hex(16))
+    try:
+        os.link(temp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(temp_path)
+    with open(path, 'r', encoding='ascii') as file:
+        return file.read().strip()
+
+
+def send(port, message, timeout=TIMEOUT):
+    """Отправляет сообщение (словарь) и возвращает ответ (словарь)"""
+    message = dict(message, token=read_token())
+    try:
+        connection = socket.create_connection((HOST, port), timeout=timeout)
+    except OSError as error:
+        raise NotRunningError(f'Процесс на порту {port} не запущен') from error
+    try:
+        with connection:
+            connection.sendall(json.dumps(message).encode('utf-8') + b'\n')
+            with connection.makefile('rb') as stream:
+                line = stream.readline()
+    except OSError as error:
+        raise ChannelError(f'Процесс на порту {port} недоступен') from error
+    if not line:
+        raise ChannelError(f'Процесс на порту {port} не ответил')
+    response = json.loads(line)
+    if not response.get('ok'):
+        raise ChannelError(response.get('error', 'Неизвестная ошибка'))
+    return response
+
+
+class Server:
+    """Сервер, принимающий сообщения и передающий их обработчику.
+       Обработчик получает словарь и возвращает словарь с ответом
+       (или None, если ответить нечего)"""
+
+    def __init__(self, port, handler):
+        self.handler = handler
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Занятый порт должен оставаться занятым (блокировка),
+        # но освободившийся - сразу доступен для перезапуска процесса
+        if hasattr(socket, 'SO_EXCLUSIVEADDRUSE'):
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+        else:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            # Если порт уже занят, значит процесс уже запущен - вызывается OSError
+            self.socket.bind((HOST, port))
+        except OSError:
+            self.socket.close()
+            raise
+        self.socket.listen()
+
+    def serve_forever(self):
+        while True:
+            try:
+                connection, _ = self.socket.accept()
+            except OSError:
+                # Сокет закрыт методом close
+                return
+            with connection:
+                self._handle(connection)
+
+    def start(self):
+        """Запускает сервер в отдельном потоке"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        self.socket.close()
+
+    def _handle(self, connection):
+        connection.settimeout(TIMEOUT)
+        try:
+            with connection.makefile('rb') as stream:
+                line = stream.readline()
+            if not line:
+                return
+            try:
+                message = json.loads(line)
+                token = message.pop('token', None)
+                if not isinstance(token, str) or \
+                        not hmac.compare_digest(token, read_token()):
+                    raise PermissionError('Сообщение отправлено другим пользователем')
+                response = self.handler(message) or {}
+                response.setdefault('ok', True)
+            except Exception as error:
+                response = {'ok': False, 'error': str(error)}
+            connection.sendall(json.dumps(response).encode('utf-8') + b'\n')
+        except OSError:
+            # Клиент отключился, не дождавшись ответа
+            pass
@@ -0,0 +1,183 @@
+"""Метрики доставки напоминаний.
+
+   Каждый процесс приложения ведёт свой набор метрик (get_metrics):
+   счётчики и гистограммы с фиксированными границами корзин, поэтому
+   память не растёт с числом событий. Метрики периодически записываются
+   в json файл в папке METRICS_DIR (start_dumping), а также отдаются
+   командой 'metrics' по управляющему каналу процесса (см. ipc)."""
+from bisect import bisect_left
+from collections import deque
+from threading import Thread, Lock, Event
+import datetime as dt
+import json
+import os
+import time
+
+
+METRICS_DIR = 'metrics'
+DUMP_INTERVAL = 60  # Как часто записывать метрики в файл (в секундах)
+# Границы корзин гистограмм опоздания (в секундах)
+LATENESS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300, 3600)
+# Границы корзин гистограмм размеров пачек напоминаний
+BATCH_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 1000)
+# Напоминание, опоздавшее больше чем на столько секунд, считается пропущенным
+# (например, компьютер спал в момент его прихода)
+MISSED_AFTER = 60
+RATE_INTERVAL = 60  # Длительность интервала для подсчёта доставок (в секундах)
+RATE_INTERVALS = 60  # Сколько последних интервалов хранить
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин.
+       В корзину i попадают значения, не превышающие bounds[i],
+       в последнюю корзину - всё, что больше последней границы"""
+
+    def __init__(self, bounds=LATENESS_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = None
+
+    def record(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Верхняя граница корзины, в которую попадает квантиль q
+           (для последней корзины - максимальное значение)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {'bounds': list(self.bounds), 'counts': list(self.counts),
+                'count': self.count, 'sum': self.total, 'max': self.max,
+                'p50': self.quantile(0.5), 'p99': self.quantile(0.99)}
+
+
+class RateCounter:
+    """Число событий за каждый из последних RATE_INTERVALS интервалов"""
+
+    def __init__(self, interval=RATE_INTERVAL, size=RATE_INTERVALS):
+        self.interval = interval
+        self.intervals = deque(maxlen=size)  # Элементы [начало интервала, число событий]
+
+    def record(self, now=None):
+        now = time.time() if now is None else now
+        start = now - now % self.interval
+        if self.intervals and self.intervals[-1][0] == start:
+            self.intervals[-1][1] += 1
+        else:
+            self.intervals.append([start, 1])
+
+    def snapshot(self):
+        return {'interval': self.interval,
+                'counts': [[dt.datetime.fromtimestamp(start).isoformat(' ', 'seconds'), count]
+                           for start, count in self.intervals]}
+
+
+class Metrics:
+    """Набор метрик процесса. Методы можно вызывать из любого потока"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.started = dt.datetime.now()
+        self.counters = {}
+        self.histograms = {}
+        self.rates = {}
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value, bounds=LATENESS_BUCKETS):
+        """Записывает значение в гистограмму name
+           (bounds - границы корзин, если гистограммы ещё нет)"""
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(bounds)
+            histogram.record(value)
+
+    def mark(self, name):
+        """Отмечает событие name в счётчике событий по интервалам"""
+        with self.lock:
+            rate = self.rates.get(name)
+            if rate is None:
+                rate = self.rates[name] = RateCounter()
+            rate.record()
+
+    def record_lateness(self, name, scheduled, now=None):
+        """Записывает опоздание события относительно времени scheduled.
+           Сильно опоздавшие события ещё и считаются пропущенными"""
+        now = dt.datetime.now() if now is None else now
+        lateness = max((now - scheduled).total_seconds(), 0.0)
+        self.observe(name, lateness)
+        if lateness > MISSED_AFTER:
+            self.increment(name + '_missed')
+
+    def snapshot(self):
+        with self.lock:
+            return {'started': self.started.isoformat(' ', 'seconds'),
+                    'updated': dt.datetime.now().isoformat(' ', 'seconds'),
+                    'counters': dict(self.counters),
+                    'histograms': {name: histogram.snapshot()
+                                   for name, histogram in self.histograms.items()},
+                    'rates': {name: rate.snapshot() for name, rate in self.rates.items()}}
+
+    def dump(self, path):
+        """Записывает метрики в json файл. Файл заменяется целиком,
+           поэтому читающий его никогда не увидит половину записи"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.snapshot(), file, ensure_ascii=False, indent=2)
+        os.replace(temp_path, path)
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    """Возвращает метрики текущего процесса"""
+    return _metrics
+
+
+def metrics_path(process):
+    return os.path.join(METRICS_DIR, process + '.json')
+
+
+def start_periodic(function, interval):
+    """Запускает поток, вызывающий function раз в interval секунд.
+       Возвращает событие, установка которого останавливает поток"""
+    stopped = Event()
+
+    def loop():
+        while not stopped.wait(interval):
+            function()
+
+    Thread(target=loop, daemon=True).start()
+    return stopped
+
+
+def start_dumping(process, interval=DUMP_INTERVAL):
+    """Запускает поток, записывающий метрики процесса process в файл раз в interval
+       секунд. Возвращает событие, установка которого останавливает поток"""
+
+    def dump():
+        try:
+            _metrics.dump(metrics_path(process))
+        except OSError:
+            pass
+
+    return start_periodic(dump, interval)
@@ -1,25 +1,31 @@
-from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel
-from PyQt5.QtCore import Qt, QUrl, QThread
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QLabel, QWidget, QScrollArea,
+                             QVBoxLayout, QHBoxLayout, QPushButton, QSpinBox, QFrame)
+from PyQt5.QtCore import Qt, QObject, pyqtSignal
 from PyQt5.QtGui import QFont, QIcon
-from PyQt5 import uic, QtMultimedia
-from time import sleep
+import datetime as dt
 import os
 import sys
 import ui_resources
+from ui_forms import load_form
+from ipc import Server, NOTIFIER_PORT
+from audio import get_audio_engine
+from notify_client import request_snooze
+from storage import DB_PATH
+from metrics import get_metrics, start_dumping
+from history import get_history, start_flushing, SHOWN, SNOOZED, DISMISSED
 
 
 class NotifyWindow(QMainWindow):
-    def __init__(self, title, text, song):
+    def __init__(self, title, text, song, notification_id=None, profile=DB_PATH):
         super().__init__()
+        self.notification_id = notification_id
+        self.profile = profile  # Путь к базе данных профиля, которому принадлежит уведомление
         self.title = title
         self.text = text
-        if song != 'None':
-            path = os.getcwd() + '\\resources\\audio\\'
-            media = QUrl.fromLocalFile(path + song + '.wav')
-            self.song = QtMultimedia.QMediaContent(media)
-        else:
-            self.song = None
-        uic.loadUi('resources\\ui\\NotifyWindow.ui', self)
+        self.song = song
+        self.sound = None  # Звучащая сейчас мелодия
+        self.snoozed = False  # Отложено ли уведомление (иначе при закрытии оно закрыто)
+        load_form('NotifyWindow', self)
         self.initUi()
         self.play_song()
     
@@ -31,7 +37,7 @@ class NotifyWindow(QMainWindow):
         if width < 100:
             width = 100
         self.title_label.setFixedWidth(width)
-        self.title_label.move((575 - width) / 2, 20)
+        self.title_label.move((575 - width) // 2, 20)
         self.text_label = QLabel(self.text, self)
         self.text_label.resize(400, 200)
         self.text_label.setStyleSheet('''background: none;
@@ -46,20 +52,24 @@ class NotifyWindow(QMainWindow):
     
     def play_song(self):
         """Воспроизводит звук уведомления"""
-        if self.song is not None:
-            # Звук будет воспроизводиться в отдельном потоке
-            self.music_thread = MusicThread(self.song)
-            self.music_thread.start()
+        # Мелодии заранее загружены в память, поэтому звук начинается сразу
+        self.sound = get_audio_engine().play(self.song)
+
+    def stop_song(self):
+        if self.sound is not None:
+            self.sound.stop()
+            self.sound = None
     
     def postpone(self):
         """Откладывает уведомление на выбранный пользователем срок"""
-        if self.song is not None:
-            self.music_thread.kill()
-        self.hide()
-        sleep(self.postpone_time_selecter.value() * 60)
-        self.show()
-        self.play_song()
-        self.activateWindow()
+        # Окно закрывается сразу, а отложенное уведомление планирует фоновый модуль:
+        # когда срок выйдет, оно будет показано снова
+        self.stop_song()
+        request_snooze(self.notification_id, self.title, self.text, self.song,
+                       self.postpone_time_selecter.value(), self.profile)
+        self.snoozed = True
+        get_history().record(SNOOZED, self.notification_id, self.title, self.profile)
+        self.close()
     
     def keyPressEvent(self, event):
         # Клавиша enter откладывает уведомление, а escape закрывает
@@ -69,24 +79,214 @@ class NotifyWindow(QMainWindow):
             self.close()
     
     def closeEvent(self, e):
-        # Необходимо убить поток, воспроизводящий звук, иначе PyQt ругается
-        if self.song is not None:
-            self.music_thread.kill()
+        self.stop_song()
+        if not self.snoozed:
+            get_history().record(DISMISSED, self.notification_id, self.title, self.profile)
 
 
-class MusicThread(QThread):
-    """Поток для воспроизведения звука оповещения"""
-    def __init__(self, song):
+class GroupNotifyWindow(QWidget):
+    """Одно окно для нескольких уведомлений, пришедших одновременно.
+       Звучит одна мелодия, а каждое уведомление можно закрыть
+       или отложить отдельно"""
+    BUTTON_STYLESHEET = '''background: none;
+                           background-color: rgb(255, 255, 255);
+                           border: 2px solid;
+                           border-radius: 12px;'''
+
+    def __init__(self, items):
         super().__init__()
-        self.player = QtMultimedia.QMediaPlayer()
-        self.player.setMedia(song)
-    
-    def run(self):
-        self.player.play()
-        sleep(5)
-    
-    def kill(self):
-        self.player.stop()
+        self.items = items
+        self.rows = {}  # Строки списка: "номер уведомления в items: виджет строки"
+        # Звучит мелодия первого уведомления, у которого она задана
+        self.song = next((item['song'] for item in items
+                          if item['song'] not in (None, 'None')), None)
+        self.sound = None
+        self.initUi()
+        self.play_song()
+
+    def initUi(self):
+        icon = QIcon(os.getcwd() + '\\resources\\images\\icon.ico')
+        self.setWindowIcon(icon)
+        self.setWindowTitle(f'Напоминания: {len(self.items)}')
+        self.resize(575, 450)
+        self.setStyleSheet('''background-image: url(:/images/notify_theme.jpg);
+                              background-repeat: no-repeat;
+                              background-position: center;''')
+        list_widget = QWidget()
+        list_widget.setStyleSheet('background: none;')
+        list_layout = QVBoxLayout(list_widget)
+        for index, item in enumerate(self.items):
+            row = self.create_row(index, item)
+            self.rows[index] = row
+            list_layout.addWidget(row)
+        list_layout.addStretch()
+        scroll_area = QScrollArea(self)
+        scroll_area.setWidgetResizable(True)
+        scroll_area.setWidget(list_widget)
+        self.postpone_time_selecter = QSpinBox(self)
+        self.postpone_time_selecter.setRange(1, 99)
+        self.postpone_time_selecter.setValue(5)
+        self.postpone_time_selecter.setFont(QFont('Arial', 14))
+        self.postpone_time_selecter.setStyleSheet('''background: none;
+                                                     background-color: rgb(255, 255, 255);
+                                                     border: 1px solid;''')
+        postpone_all_btn = self.create_button('Отложить все')
+        postpone_all_btn.clicked.connect(self.postpone_all)
+        close_all_btn = self.create_button('Закрыть все')
+        close_all_btn.clicked.connect(self.close)
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addWidget(QLabel('Отложить на (минут):', self))
+        buttons_layout.addWidget(self.postpone_time_selecter)
+        buttons_layout.addWidget(postpone_all_btn)
+        buttons_layout.addWidget(close_all_btn)
+        layout = QVBoxLayout(self)
+        layout.addWidget(scroll_area)
+        layout.addLayout(buttons_layout)
+
+    def create_button(self, text):
+        button = QPushButton(text, self)
+        button.setFont(QFont('Arial', 12))
+        button.setFixedHeight(30)
+        button.setStyleSheet(self.BUTTON_STYLESHEET)
+        return button
+
+    def create_row(self, index, item):
+        row = QFrame()
+        row.setStyleSheet('''QFrame {background-color: rgb(255, 255, 255);
+                                     border: 2px solid black;
+                                     border-radius: 20px;}
+                              QLabel {border: none;}''')
+        title_label = QLabel(item['title'], row)
+        title_label.setFont(QFont('Arial', 14, QFont.Bold))
+        text_label = QLabel(item['text'], row)
+        text_label.setFont(QFont('Arial', 12))
+        text_label.setWordWrap(True)
+        postpone_btn = self.create_button('Отложить')
+        postpone_btn.clicked.connect(lambda: self.postpone(index))
+        close_btn = self.create_button('Закрыть')
+        close_btn.clicked.connect(lambda: self.dismiss(index))
+        labels_layout = QVBoxLayout()
+        labels_layout.addWidget(title_label)
+        labels_layout.addWidget(text_label)
+        layout = QHBoxLayout(row)
+        layout.addLayout(labels_layout, 1)
+        layout.addWidget(postpone_btn)
+        layout.addWidget(close_btn)
+        return row
+
+    def play_song(self):
+        self.sound = get_audio_engine().play(self.song)
+
+    def stop_song(self):
+        if self.sound is not None:
+            self.sound.stop()
+            self.sound = None
+
+    def dismiss(self, index, event=DISMISSED):
+        """Убирает уведомление из списка, записывая в историю событие event.
+           Когда список пуст, окно закрывается"""
+        self.stop_song()
+        self.record(index, event)
+        self.rows.pop(index).deleteLater()
+        if not self.rows:
+            self.close()
+
+    def postpone(self, index):
+        item = self.items[index]
+        request_snooze(item['notification_id'], item['title'], item['text'], item['song'],
+                       self.postpone_time_selecter.value(), item.get('profile', DB_PATH))
+        self.dismiss(index, SNOOZED)
+
+    def postpone_all(self):
+        for index in list(self.rows):
+            self.postpone(index)
+
+    def keyPressEvent(self, event):
+        # Клавиша enter откладывает все уведомления, а escape закрывает
+        if event.key() == 16777220:
+            self.postpone_all()
+        elif event.key() == 16777216:
+            self.close()
+
+    def record(self, index, event):
+        item = self.items[index]
+        get_history().record(event, item['notification_id'], item['title'],
+                             item.get('profile', DB_PATH))
+
+    def closeEvent(self, e):
+        self.stop_song()
+        # Уведомления, оставшиеся в списке, закрываются вместе с окном
+        for index in self.rows:
+            self.record(index, DISMISSED)
+
+
+class NotifyHost(QObject):
+    """Постоянно работающий процесс, показывающий уведомления.
+       Запросы на показ приходят через локальный сокет из другого потока
+       и передаются в поток интерфейса сигналом"""
+    show_requested = pyqtSignal(dict)
+
+    def __init__(self, server):
+        super().__init__()
+        self.windows = set()  # Открытые окна уведомлений
+        self.show_requested.connect(self.show_notification)
+        self.server = server
+        self.server.handler = self.handle_request
+
+    def handle_request(self, message):
+        if message.get('command') == 'metrics':
+            return {'metrics': get_metrics().snapshot()}
+        if message.get('command') != 'show':
+            raise ValueError(f'Неизвестная команда: {message.get("command")}')
+        self.show_requested.emit(message)
+
+    def show_notification(self, message):
+        # Уведомления, пришедшие одновременно, показываются одним окном
+        items = message['items']
+        if len(items) == 1:
+            item = items[0]
+            notify_window = NotifyWindow(item['title'], item['text'], item['song'],
+                                         item.get('notification_id'),
+                                         item.get('profile', DB_PATH))
+        else:
+            notify_window = GroupNotifyWindow(items)
+        notify_window.setAttribute(Qt.WA_DeleteOnClose)
+        notify_window.destroyed.connect(lambda: self.windows.discard(notify_window))
+        self.windows.add(notify_window)
+        notify_window.show()
+        notify_window.activateWindow()
+        # Опоздание считается от запланированного времени до показа окна,
+        # то есть включает и планировщик, и передачу запроса, и создание окна
+        metrics = get_metrics()
+        for item in items:
+            get_history().record(SHOWN, item.get('notification_id'), item['title'],
+                                 item.get('profile', DB_PATH))
+            metrics.mark('shown')
+            if item.get('scheduled_at'):
+                metrics.record_lateness('shown_lateness',
+                                        dt.datetime.fromisoformat(item['scheduled_at']))
+
+
+def run_host(port=NOTIFIER_PORT):
+    """Запускает процесс в режиме показа уведомлений по запросу,
+       приходящему на порт port"""
+    try:
+        server = Server(port, None)
+    except OSError:
+        # Процесс уже запущен
+        sys.exit(0)
+    app = QApplication(sys.argv)
+    # Процесс должен жить и тогда, когда ни одного уведомления не показано
+    app.setQuitOnLastWindowClosed(False)
+    # Мелодии загружаются до первого уведомления
+    get_audio_engine()
+    host = NotifyHost(server)
+    start_dumping('notify' if port == NOTIFIER_PORT else f'notify_{port}')
+    start_flushing()
+    # Накопленные, но ещё не записанные события не должны теряться при выходе
+    app.aboutToQuit.connect(get_history().flush)
+    server.start()
+    sys.exit(app.exec_())
 
 
 def parse_cmd_args(args):
@@ -95,11 +295,20 @@ def parse_cmd_args(args):
 
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
     # Данный модуль может запускаться исключительно другим
     # модулем приложения(не пользователем), с помощью subprocess.Popen().
+    # С аргументом --host модуль работает постоянно и показывает
+    # уведомления, присылаемые через локальный сокет(см. notify_client).
+    # Порт можно задать аргументом --port (у разных профилей могут быть
+    # разные процессы notify)
+    if sys.argv[1:2] == ['--host']:
+        run_host(int(sys.argv[3]) if sys.argv[2:3] == ['--port'] else NOTIFIER_PORT)
+    app = QApplication(sys.argv)
+    # Иначе показывается одно уведомление.
     # Заголовок, текст и звук уведомления передаются как аргументы командной строки
     notify_window = NotifyWindow(*parse_cmd_args(sys.argv))
     notify_window.show()
     notify_window.activateWindow()
-    sys.exit(app.exec_())
+    code = app.exec_()
+    get_history().flush()
+    sys.exit(code)
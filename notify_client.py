@@ -0,0 +1,114 @@
+"""Отправка уведомлений процессу notify, запущенному в режиме --host.
+
+   Процесс notify запускается один раз, при первом уведомлении, и дальше
+   показывает все уведомления сам: без запуска нового процесса на каждое."""
+from ipc import send, ChannelError, NotRunningError, NOTIFIER_PORT, DAEMON_PORT
+from storage import get_database, DB_PATH
+from metrics import get_metrics
+from queue import Queue
+from threading import Thread, Lock
+from time import sleep, monotonic
+import datetime as dt
+import os
+import subprocess
+import sys
+
+
+HOST_START_TIMEOUT = 15  # Сколько секунд ждать запуска процесса notify
+
+_queue = Queue()
+_worker = None
+_worker_lock = Lock()
+
+
+def alert(title, text, song, notification_id=None, scheduled=None, profile=DB_PATH):
+    """Описание одного уведомления для show_notifications.
+       scheduled - время, на которое уведомление было запланировано,
+       profile - путь к базе данных профиля, которому принадлежит уведомление"""
+    return {'title': title, 'text': text, 'song': song, 'notification_id': notification_id,
+            'scheduled_at': None if scheduled is None else scheduled.isoformat(' '),
+            'profile': profile}
+
+
+def show_notifications(alerts, port=NOTIFIER_PORT, done=None):
+    """Ставит уведомления в очередь на показ и сразу возвращает управление.
+       Несколько уведомлений, пришедших одновременно, показываются одним окном
+       со списком и одним звуком. Уведомления отправляются по порядку
+       из отдельного потока, поэтому ни окно, ни планировщик не ждут
+       запуска процесса notify. port - порт процесса notify
+       (у каждого профиля может быть свой). Если задана функция done,
+       после попытки отправки она вызывается из потока отправки
+       с аргументом True, если процесс notify принял уведомления, иначе False"""
+    global _worker
+    if not alerts:
+        return
+    with _worker_lock:
+        if _worker is None:
+            _worker = Thread(target=_send_loop, daemon=True)
+            _worker.start()
+    _queue.put((port, {'command': 'show', 'items': list(alerts)}, done))
+
+
+def request_snooze(notification_id, title, text, song, minutes, profile=DB_PATH):
+    """Откладывает уведомление профиля profile на minutes минут.
+       Отложенные уведомления присылает фоновый модуль. Если он не запущен,
+       уведомление просто сохраняется в базу данных, и фоновый модуль
+       подхватит его при запуске"""
+    message = {'command': 'snooze', 'notification_id': notification_id,
+               'title': title, 'text': text, 'song': song, 'minutes': minutes,
+               'profile': os.path.realpath(profile)}
+    try:
+        send(DAEMON_PORT, message)
+    except NotRunningError:
+        fire_at = dt.datetime.now() + dt.timedelta(minutes=minutes)
+        get_database(profile).add_snooze(notification_id, title, text, song, fire_at)
+    except ChannelError as error:
+        # Фоновый модуль получил сообщение, но не ответил вовремя или ответил ошибкой.
+        # Сохранять уведомление в базу нельзя: фоновый модуль мог уже сохранить его,
+        # и тогда оно пришло бы дважды
+        get_metrics().increment('snooze_errors')
+        print(f'Не удалось отложить уведомление: {error}', file=sys.stderr)
+
+
+def _send_loop():
+    while True:
+        port, message, done = _queue.get()
+        start = monotonic()
+        sent = False
+        try:
+            _deliver(port, message)
+            sent = True
+            # Сюда входит и запуск процесса notify, если он не был запущен
+            get_metrics().observe('notifier_send_seconds', monotonic() - start)
+        except (ChannelError, OSError):
+            # Процесс notify так и не запустился (или его даже не удалось запустить:
+            # OSError из Popen) - уведомление теряется, но поток отправки живёт,
+            # и следующие уведомления попробуют запустить процесс снова
+            get_metrics().increment('notifier_lost', len(message['items']))
+        if done is not None:
+            try:
+                done(sent)
+            except Exception:
+                # Например, база данных занята: поток отправки всё равно должен жить
+                get_metrics().increment('notifier_callback_errors')
+
+
+def _deliver(port, message):
+    try:
+        send(port, message)
+        return
+    except ChannelError:
+        # Процесс notify ещё не запущен
+        args = ['notify', '--host']
+        if port != NOTIFIER_PORT:
+            args += ['--port', str(port)]
+        subprocess.Popen(args)
+    deadline = monotonic() + HOST_START_TIMEOUT
+    while True:
+        sleep(0.1)
+        try:
+            send(port, message)
+            return
+        except ChannelError:
+            if monotonic() > deadline:
+                raise
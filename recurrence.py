@@ -0,0 +1,156 @@
+"""Вычисление ближайшего времени прихода напоминаний.
+
+   Время считается по замкнутым формулам, без перебора дней:
+   для дней недели - поворотом семибитной маски и поиском младшего бита,
+   для конкретных дат - двоичным поиском по отсортированным номерам дней.
+   next_fire считает время одного напоминания, next_fires - сразу многих
+   с помощью NumPy (если NumPy не установлен, то по одному).
+   occurrences лениво перечисляет все времена прихода напоминания
+   в промежутке времени"""
+from bisect import bisect_left
+from threading import Lock
+import datetime as dt
+
+
+ONCE, WEEKLY, DATES = 0, 1, 2  # Режимы повтора (см. Notification.repeating_mode)
+EPOCH_ORDINAL = dt.date(1970, 1, 1).toordinal()  # Номер дня начала отсчёта datetime64
+ORDINAL_BITS = 22  # Номера дней (date.toordinal()) не превышают 2 ** 22
+
+
+def _lowest_bit(mask):
+    """Номер младшего единичного бита маски"""
+    return (mask & -mask).bit_length() - 1
+
+
+LOWEST_BITS = [_lowest_bit(mask) if mask else 0 for mask in range(128)]
+
+
+def _rotate(mask, shift):
+    """Поворачивает семибитную маску дней недели так, что день shift становится первым"""
+    return ((mask >> shift) | (mask << (7 - shift))) & 0b1111111
+
+
+def next_fire(mode, time, week_mask, date_ordinals, now):
+    """Возвращает ближайшее после now время прихода напоминания, либо None.
+       mode - режим повтора, time - время напоминания (для режима ONCE
+       важна и дата), week_mask - маска дней недели (понедельник - младший бит),
+       date_ordinals - отсортированные номера дней (date.toordinal())"""
+    if mode == ONCE:
+        return time if time > now else None
+    today = now.date()
+    time_of_day = dt.time(time.hour, time.minute)
+    # Если время напоминания сегодня уже прошло, искать нужно начиная с завтра
+    start = 0 if time_of_day > now.time() else 1
+    if mode == WEEKLY:
+        rotated = _rotate(week_mask, (today.weekday() + start) % 7)
+        if not rotated:
+            return None
+        day = today + dt.timedelta(start + _lowest_bit(rotated))
+    else:
+        index = bisect_left(date_ordinals, today.toordinal() + start)
+        if index == len(date_ordinals):
+            return None
+        day = dt.date.fromordinal(date_ordinals[index])
+    return dt.datetime.combine(day, time_of_day)
+
+
+def occurrences(mode, time, week_mask, date_ordinals, start, end=None):
+    """Лениво перечисляет по возрастанию времена прихода напоминания,
+       лежащие после start и до end (end=None - без конца).
+       Аргументы - как у next_fire. Каждое следующее время - это ближайшее
+       время прихода после предыдущего, поэтому генератор не перебирает дни"""
+    time = next_fire(mode, time, week_mask, date_ordinals, start)
+    while time is not None and (end is None or time < end):
+        yield time
+        time = next_fire(mode, time, week_mask, date_ordinals, time)
+
+
+_clock_lock = Lock()
+_clock_epoch = 0
+_last_now = None
+
+
+def clock_epoch(now):
+    """Номер "эпохи" часов. Он меняется при смене дня и при переводе часов назад,
+       и вместе с ним становятся недействительными все сохранённые
+       ранее времена прихода (см. Notification.next_time)"""
+    global _clock_epoch, _last_now
+    with _clock_lock:
+        if _last_now is not None and (now < _last_now or now.date() != _last_now.date()):
+            _clock_epoch += 1
+        _last_now = now
+        return _clock_epoch
+
+
+def next_fires(modes, times, week_masks, date_ordinals, date_offsets, now=None):
+    """Считает ближайшее время прихода сразу для многих напоминаний.
+       Аргументы - массивы одинаковой длины n (для i-го напоминания):
+       modes - режимы повтора, times - время напоминания (datetime64, для режима
+       ONCE важна и дата), week_masks - маски дней недели.
+       Даты всех напоминаний лежат подряд в date_ordinals: даты i-го напоминания -
+       это date_ordinals[date_offsets[i]:date_offsets[i + 1]], отсортированные.
+       Возвращает массив datetime64[s], где NaT означает "не придёт никогда"""
+    import numpy as np
+
+    now = dt.datetime.now() if now is None else now
+    modes = np.asarray(modes)
+    times = np.asarray(times, dtype='datetime64[s]')
+    week_masks = np.asarray(week_masks, dtype=np.int64)
+    date_ordinals = np.asarray(date_ordinals, dtype=np.int64)
+    date_offsets = np.asarray(date_offsets, dtype=np.int64)
+    now64 = np.datetime64(now.replace(microsecond=0), 's')
+    today = np.datetime64(now.date(), 'D')
+    rows = np.arange(len(modes), dtype=np.int64)
+
+    time_of_day = (times - times.astype('datetime64[D]')).astype(np.int64) // 60 * 60
+    now_seconds = (now64 - today).astype(np.int64)
+    start = np.where(time_of_day > now_seconds, 0, 1)
+
+    # Дни недели: поворот маски и поиск младшего бита по таблице
+    shift = (now.weekday() + start) % 7
+    rotated = ((week_masks >> shift) | (week_masks << (7 - shift))) & 0b1111111
+    weekly_delta = start + np.array(LOWEST_BITS, dtype=np.int64)[rotated]
+    weekly_ok = rotated != 0
+
+    # Конкретные даты: один двоичный поиск по всем напоминаниям сразу.
+    # К номеру дня приписывается номер напоминания, и массив остаётся отсортированным
+    date_rows = np.repeat(rows, np.diff(date_offsets))
+    keys = (date_rows << ORDINAL_BITS) | date_ordinals
+    threshold = now.date().toordinal() + start
+    positions = np.searchsorted(keys, (rows << ORDINAL_BITS) | threshold)
+    dates_ok = positions < date_offsets[1:]
+    found = date_ordinals[np.minimum(positions, len(date_ordinals) - 1)] \
+        if len(date_ordinals) else np.zeros(len(modes), dtype=np.int64)
+    dates_delta = found - EPOCH_ORDINAL - (today - np.datetime64(0, 'D')).astype(np.int64)
+
+    delta = np.where(modes == WEEKLY, weekly_delta, dates_delta)
+    repeating = today + delta.astype('timedelta64[D]') + time_of_day.astype('timedelta64[s]')
+    result = np.where(modes == ONCE, times, repeating)
+    never = np.where(modes == ONCE, times <= now64,
+                     np.where(modes == WEEKLY, ~weekly_ok, ~dates_ok))
+    result[never] = np.datetime64('NaT')
+    return result
+
+
+def next_times(notifys, now=None):
+    """Возвращает список ближайших времён прихода напоминаний
+       (None для выключенных и тех, что больше не придут)"""
+    now = dt.datetime.now() if now is None else now
+    try:
+        import numpy as np
+    except ImportError:
+        return [next_fire(notify.repeating_mode, notify.time, notify.week_mask,
+                          notify.date_ordinals, now) if notify.included else None
+                for notify in notifys]
+    date_ordinals = []
+    date_offsets = [0]
+    for notify in notifys:
+        date_ordinals.extend(notify.date_ordinals)
+        date_offsets.append(len(date_ordinals))
+    times = next_fires([notify.repeating_mode for notify in notifys],
+                       np.array([notify.time for notify in notifys], dtype='datetime64[s]'),
+                       [notify.week_mask for notify in notifys],
+                       date_ordinals, date_offsets, now)
+    included = np.array([notify.included for notify in notifys], dtype=bool)
+    times[~included] = np.datetime64('NaT')
+    return times.astype(object).tolist()
@@ -0,0 +1,143 @@
+import datetime as dt
+import heapq
+import itertools
+import threading
+from metrics import get_metrics, BATCH_BUCKETS
+
+
+class Scheduler:
+    """Очередь напоминаний, упорядоченная по времени прихода.
+
+       Напоминания хранятся в двоичной куче из элементов
+       [время прихода, порядковый номер, напоминание], поэтому несколько
+       напоминаний на одно и то же время не затирают друг друга.
+       Модуль не зависит от PyQt5: фоновый модуль крутит планировщик
+       в отдельном потоке (метод run), а главное окно - через один QTimer
+       (методы next_deadline и pop_due)"""
+
+    # Максимальная длительность одного сна в методе run (в секундах).
+    # Ограничение нужно, чтобы перевод системных часов не сбивал расписание надолго
+    MAX_SLEEP = 3600
+    # Окно объединения (в секундах): напоминания, которые придут в течение этого времени
+    # после ближайшего, присылаются вместе с ним одной пачкой - одним уведомлением
+    # со списком. Ближайшее напоминание при этом не ждёт окно и приходит вовремя
+    COALESCE_WINDOW = 1
+
+    def __init__(self, coalesce_window=COALESCE_WINDOW):
+        self.coalesce_window = dt.timedelta(seconds=coalesce_window)
+        self._heap = []
+        self._entries = {}  # Словарь "напоминание: его элемент в куче"
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, notify):
+        return notify in self._entries
+
+    def schedule(self, notify, time):
+        """Ставит напоминание в очередь на время time.
+           Если напоминание уже стоит в очереди, его время заменяется"""
+        with self._condition:
+            self._discard(notify)
+            entry = [time, next(self._counter), notify]
+            self._entries[notify] = entry
+            heapq.heappush(self._heap, entry)
+            # Если напоминание оказалось ближайшим, спящий поток надо разбудить
+            if self._heap[0] is entry:
+                self._condition.notify_all()
+
+    def discard(self, notify):
+        """Убирает напоминание из очереди (если оно там есть)"""
+        with self._condition:
+            self._discard(notify)
+
+    def next_deadline(self):
+        """Возвращает время прихода ближайшего напоминания, либо None"""
+        with self._condition:
+            return self._next_deadline()
+
+    def pop_due(self, now=None):
+        """Достаёт из очереди все напоминания, время которых наступит
+           не позже now (по умолчанию - сейчас) плюс окно объединения.
+           Возвращает список пар (время прихода, напоминание)"""
+        with self._condition:
+            now = dt.datetime.now() if now is None else now
+            return self._pop_due(now + self.coalesce_window)
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def run(self, deliver, retry=None):
+        """Основной цикл планировщика. Спит до ближайшего напоминания
+           и вызывает deliver(due) со списком наступивших напоминаний
+           и напоминаний из окна объединения - пар (время прихода, напоминание).
+           deliver вызывается без блокировки, поэтому может снова ставить
+           напоминания в очередь. Ошибка в deliver не останавливает поток:
+           она считается в метриках (scheduler_errors), а для каждого напоминания
+           пачки вызывается retry(время прихода, напоминание), которая должна
+           снова поставить его в очередь (без retry пачка теряется).
+           Число пробуждений потока записывается в метрики процесса"""
+        metrics = get_metrics()
+        while True:
+            with self._condition:
+                due = []
+                while not self._stopped and not due:
+                    now = dt.datetime.now()
+                    deadline = self._next_deadline()
+                    if deadline is not None and deadline <= now:
+                        due = self._pop_due(now + self.coalesce_window)
+                        break
+                    if deadline is None:
+                        self._condition.wait()
+                    else:
+                        timeout = (deadline - now).total_seconds()
+                        self._condition.wait(min(timeout, self.MAX_SLEEP))
+                    metrics.increment('scheduler_wakeups')
+                if self._stopped:
+                    return
+            metrics.increment('scheduler_deliveries', len(due))
+            metrics.observe('scheduler_batch_size', len(due), BATCH_BUCKETS)
+            try:
+                deliver(due)
+            except Exception:
+                # Например, база данных занята другим процессом дольше busy_timeout.
+                # Без этого поток планировщика умер бы, и напоминания перестали бы приходить
+                metrics.increment('scheduler_errors')
+                if retry is not None:
+                    self._retry(retry, due)
+
+    def _retry(self, retry, due):
+        for time, notify in due:
+            try:
+                retry(time, notify)
+            except Exception:
+                get_metrics().increment('scheduler_errors')
+
+    def _discard(self, notify):
+        entry = self._entries.pop(notify, None)
+        if entry is not None:
+            # Из середины кучи элемент не удалить, поэтому он лишь помечается удалённым
+            entry[-1] = None
+            if len(self._heap) > 2 * len(self._entries) + 32:
+                # Если удалённых элементов накопилось много, куча перестраивается
+                self._heap = [item for item in self._heap if item[-1] is not None]
+                heapq.heapify(self._heap)
+
+    def _next_deadline(self):
+        while self._heap and self._heap[0][-1] is None:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            time, _, notify = heapq.heappop(self._heap)
+            if notify is not None:
+                del self._entries[notify]
+                due.append((time, notify))
+        return due
@@ -0,0 +1,575 @@
+"""Работа с базой данных напоминаний.
+
+   Все данные напоминания хранятся в одной базе SQLite: дни недели -
+   семибитной маской в столбце week_days таблицы notifications, а конкретные
+   даты - порядковыми номерами дней (date.toordinal()) в таблице notification_dates.
+   Каждый процесс держит одно долгоживущее соединение с базой (get_database).
+   История показов уведомлений разбита на таблицы по дням (history_<номер дня>):
+   старые дни удаляются целиком, через DROP TABLE, а не построчно"""
+import datetime as dt
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+DB_PATH = os.path.join('database', 'notifications_db.db')
+# json файлы, в которых раньше хранились дни недели и даты напоминаний
+# (лежат рядом с базой данных). Нужны только для однократного переноса данных в базу
+WEEK_DAYS_FILE = 'week_days.json'
+MONTH_DATES_FILE = 'month_dates.json'
+
+ALL_WEEK_DAYS = 0b1111111  # Маска "все дни недели"
+NO_SONG = 'None'  # Мелодия напоминания без звука (см. format_song)
+CACHE_SIZE_KB = 8192  # Размер страничного кэша SQLite
+BUSY_TIMEOUT_MS = 5000  # Сколько ждать, если база занята другим процессом
+HISTORY_DAYS = 30  # За сколько последних дней хранится история показов уведомлений
+TEXT_CACHE_SIZE = 256  # Сколько последних прочитанных текстов напоминаний держать в памяти
+
+
+def week_days_to_mask(week_days):
+    """Список из 7 bool (понедельник - первый) -> битовая маска"""
+    mask = 0
+    for index, state in enumerate(week_days):
+        if state:
+            mask |= 1 << index
+    return mask
+
+
+def mask_to_week_days(mask):
+    """Битовая маска -> список из 7 bool (понедельник - первый)"""
+    return [bool(mask >> index & 1) for index in range(7)]
+
+
+def format_song(song):
+    """Мелодия в том виде, в котором она хранится в базе данных.
+       Столбец song не может быть NULL, поэтому напоминание без мелодии
+       хранится со строкой NO_SONG (её же понимает процесс notify)"""
+    return NO_SONG if song is None else song
+
+
+def parse_song(song):
+    return None if song in (None, NO_SONG) else song
+
+
+def format_time(time):
+    """Время напоминания в том виде, в котором оно хранится в базе данных"""
+    return time.isoformat(' ', 'seconds')
+
+
+def migrate(connection, directory):
+    """Обновляет схему базы данных до последней версии.
+       Номер версии схемы хранится в PRAGMA user_version.
+       directory - папка, в которой лежит база данных.
+       Базу могут одновременно открыть несколько процессов (основной модуль
+       запускает фоновый), поэтому каждая миграция выполняется в транзакции,
+       сразу берущей блокировку записи, а номер версии перечитывается уже в ней:
+       миграцию, которую успел выполнить другой процесс, второй раз не выполнить.
+       Сами миграции на всякий случай тоже можно выполнять повторно"""
+    if connection.execute('PRAGMA user_version').fetchone()[0] >= len(MIGRATIONS):
+        return
+    while True:
+        with connection:
+            # Без явного BEGIN sqlite3 выполняет изменения схемы вне транзакции
+            connection.execute('BEGIN IMMEDIATE')
+            version = connection.execute('PRAGMA user_version').fetchone()[0]
+            if version >= len(MIGRATIONS):
+                return
+            MIGRATIONS[version](connection, directory)
+            connection.execute(f'PRAGMA user_version = {version + 1}')
+
+
+def _has_column(connection, table, column):
+    return any(row[1] == column for row in connection.execute(f'PRAGMA table_info({table})'))
+
+
+def _migration_1(connection, directory):
+    """Переносит дни недели и даты напоминаний из json файлов в базу данных"""
+    # Новая база данных создаётся с исходной таблицей, дальше её меняют миграции
+    connection.execute('''CREATE TABLE IF NOT EXISTS notifications (
+                              id INTEGER PRIMARY KEY AUTOINCREMENT UNIQUE NOT NULL,
+                              datetime DATETIME NOT NULL,
+                              title STRING,
+                              text TEXT,
+                              included BOOLEAN NOT NULL DEFAULT (true),
+                              repeating_mode INT NOT NULL DEFAULT (1),
+                              song STRING NOT NULL DEFAULT "default"
+                          )''')
+    if not _has_column(connection, 'notifications', 'week_days'):
+        connection.execute(f'''ALTER TABLE notifications
+                               ADD COLUMN week_days INTEGER NOT NULL DEFAULT {ALL_WEEK_DAYS}''')
+    connection.execute('''CREATE TABLE IF NOT EXISTS notification_dates (
+                              notification_id INTEGER NOT NULL
+                                  REFERENCES notifications (id) ON DELETE CASCADE,
+                              date INTEGER NOT NULL,
+                              PRIMARY KEY (notification_id, date)
+                          ) WITHOUT ROWID''')
+    connection.execute('''CREATE INDEX IF NOT EXISTS notification_dates_date
+                          ON notification_dates (date)''')
+    week_days = _read_json(os.path.join(directory, WEEK_DAYS_FILE))
+    connection.executemany('UPDATE notifications SET week_days = ? WHERE id = ?',
+                           [(week_days_to_mask(days), int(id_))
+                            for id_, days in week_days.items()])
+    month_dates = _read_json(os.path.join(directory, MONTH_DATES_FILE))
+    connection.executemany('''INSERT OR IGNORE INTO notification_dates (notification_id, date)
+                              SELECT id, ? FROM notifications WHERE id = ?''',
+                           [(dt.datetime.strptime(date, '%Y/%m/%d').toordinal(), int(id_))
+                            for id_, dates in month_dates.items() for date in dates])
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as json_file:
+            return json.loads(json_file.read())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _migration_2(connection, directory):
+    """Добавляет таблицу отложенных уведомлений"""
+    connection.execute('''CREATE TABLE IF NOT EXISTS snoozes (
+                              id INTEGER PRIMARY KEY,
+                              notification_id INTEGER,
+                              title STRING,
+                              text TEXT,
+                              song STRING,
+                              fire_at DATETIME NOT NULL
+                          )''')
+    connection.execute('CREATE INDEX IF NOT EXISTS snoozes_fire_at ON snoozes (fire_at)')
+
+
+def _migration_3(connection, directory):
+    """Добавляет полнотекстовый индекс по заголовкам и текстам напоминаний.
+       Индекс не хранит копию текстов (content='notifications'),
+       а синхронизируется с таблицей notifications триггерами"""
+    connection.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS notifications_fts USING fts5 (
+                              title, text, content='notifications', content_rowid='id'
+                          )''')
+    connection.execute('''CREATE TRIGGER IF NOT EXISTS notifications_fts_insert
+                          AFTER INSERT ON notifications BEGIN
+                              INSERT INTO notifications_fts (rowid, title, text)
+                              VALUES (new.id, new.title, new.text);
+                          END''')
+    connection.execute('''CREATE TRIGGER IF NOT EXISTS notifications_fts_delete
+                          AFTER DELETE ON notifications BEGIN
+                              INSERT INTO notifications_fts (notifications_fts, rowid, title, text)
+                              VALUES ('delete', old.id, old.title, old.text);
+                          END''')
+    connection.execute('''CREATE TRIGGER IF NOT EXISTS notifications_fts_update
+                          AFTER UPDATE OF title, text ON notifications BEGIN
+                              INSERT INTO notifications_fts (notifications_fts, rowid, title, text)
+                              VALUES ('delete', old.id, old.title, old.text);
+                              INSERT INTO notifications_fts (rowid, title, text)
+                              VALUES (new.id, new.title, new.text);
+                          END''')
+    connection.execute("INSERT INTO notifications_fts (notifications_fts) VALUES ('rebuild')")
+
+
+def _migration_4(connection, directory):
+    """Добавляет журнал изменений напоминаний. Триггеры записывают в него id
+       каждого добавленного, изменённого или удалённого напоминания (и напоминания,
+       у которого изменились даты), поэтому фоновый модуль может перечитывать
+       только изменившиеся напоминания"""
+    connection.execute('''CREATE TABLE IF NOT EXISTS change_log (
+                              seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                              notification_id INTEGER NOT NULL
+                          )''')
+    for table, column in (('notifications', 'id'), ('notification_dates', 'notification_id')):
+        for event, row in (('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old')):
+            connection.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_log_{event.lower()}
+                                   AFTER {event} ON {table} BEGIN
+                                       INSERT INTO change_log (notification_id)
+                                       VALUES ({row}.{column});
+                                   END''')
+
+
+def _migration_5(connection, directory):
+    """Добавляет список дней, за которые есть таблицы истории показов уведомлений.
+       Сами таблицы создаются по мере надобности (см. Database.add_history)"""
+    connection.execute('CREATE TABLE IF NOT EXISTS history_days (day INTEGER PRIMARY KEY)')
+
+
+MIGRATIONS = [_migration_1, _migration_2, _migration_3, _migration_4, _migration_5]
+
+
+# Запросы вынесены в константы: sqlite3 кэширует подготовленные выражения
+# по тексту запроса, поэтому на долгоживущем соединении каждый из них
+# разбирается только один раз за время работы процесса
+SELECT_DATES = 'SELECT notification_id, date FROM notification_dates ORDER BY notification_id, date'
+SELECT_NOTIFICATIONS = '''SELECT id, datetime, title, text, included,
+                                week_days, repeating_mode, song
+                         FROM notifications ORDER BY id'''
+# Для расписания тексты напоминаний не нужны, они читаются по одному (Database.text)
+SELECT_SCHEDULES = '''SELECT id, datetime, title, NULL, included,
+                            week_days, repeating_mode, song
+                     FROM notifications ORDER BY id'''
+SELECT_TEXT = 'SELECT text FROM notifications WHERE id = ?'
+# Запросы по списку id: список передаётся одним параметром - json массивом
+SELECT_DATES_BY_IDS = '''SELECT notification_id, date FROM notification_dates
+                         WHERE notification_id IN (SELECT value FROM json_each(?))
+                         ORDER BY notification_id, date'''
+SELECT_SCHEDULES_BY_IDS = '''SELECT id, datetime, title, NULL, included,
+                                   week_days, repeating_mode, song
+                            FROM notifications
+                            WHERE id IN (SELECT value FROM json_each(?))
+                            ORDER BY id'''
+SELECT_LAST_CHANGE = 'SELECT COALESCE(MAX(seq), 0) FROM change_log'
+SELECT_CHANGES = 'SELECT DISTINCT notification_id FROM change_log WHERE seq > ? AND seq <= ?'
+DELETE_CHANGES = 'DELETE FROM change_log WHERE seq <= ?'
+DELETE_NOTIFICATION = 'DELETE FROM notifications WHERE id = ?'
+UPSERT_NOTIFICATION = '''INSERT INTO notifications
+                         (id, datetime, title, text, included, week_days, repeating_mode, song)
+                         VALUES
+                         (?, ?, ?, ?, ?, ?, ?, ?)
+                         ON CONFLICT(id) DO UPDATE SET
+                         datetime = excluded.datetime, title = excluded.title,
+                         text = COALESCE(excluded.text, notifications.text),
+                         included = excluded.included,
+                         week_days = excluded.week_days,
+                         repeating_mode = excluded.repeating_mode,
+                         song = excluded.song'''
+INSERT_NOTIFICATION = '''INSERT INTO notifications
+                         (datetime, title, text, included, week_days, repeating_mode, song)
+                         VALUES
+                         (?, ?, ?, ?, ?, ?, ?)'''
+DELETE_DATES = 'DELETE FROM notification_dates WHERE notification_id = ?'
+INSERT_DATE = 'INSERT INTO notification_dates (notification_id, date) VALUES (?, ?)'
+SELECT_SNOOZES = 'SELECT id, notification_id, title, text, song, fire_at FROM snoozes ORDER BY fire_at'
+INSERT_SNOOZE = '''INSERT INTO snoozes (notification_id, title, text, song, fire_at)
+                   VALUES (?, ?, ?, ?, ?)'''
+DELETE_SNOOZE = 'DELETE FROM snoozes WHERE id = ?'
+# Последний выданный id: с AUTOINCREMENT он может быть больше максимального,
+# если последние напоминания удалены
+SELECT_LAST_ID = """SELECT MAX(COALESCE((SELECT MAX(id) FROM notifications), 0),
+                               COALESCE((SELECT seq FROM sqlite_sequence
+                                         WHERE name = 'notifications'), 0))"""
+SEARCH_NOTIFICATIONS = 'SELECT rowid FROM notifications_fts WHERE notifications_fts MATCH ?'
+SELECT_HISTORY_DAYS = 'SELECT day FROM history_days ORDER BY day'
+INSERT_HISTORY_DAY = 'INSERT INTO history_days (day) VALUES (?)'
+DELETE_HISTORY_DAY = 'DELETE FROM history_days WHERE day = ?'
+# Запросы к таблице истории за один день (имя таблицы подставляется через format)
+CREATE_HISTORY_TABLE = """CREATE TABLE IF NOT EXISTS {table} (
+                              time TEXT NOT NULL,
+                              event TEXT NOT NULL,
+                              notification_id INTEGER,
+                              title TEXT
+                          )"""
+CREATE_HISTORY_INDEX = 'CREATE INDEX IF NOT EXISTS {table}_time ON {table} (time)'
+INSERT_HISTORY = 'INSERT INTO {table} (time, event, notification_id, title) VALUES (?, ?, ?, ?)'
+SELECT_HISTORY = """SELECT time, event, notification_id, title FROM {table}
+                    WHERE time >= ? AND time < ? ORDER BY time"""
+DROP_HISTORY_TABLE = 'DROP TABLE IF EXISTS {table}'
+
+
+def history_table(day):
+    """Имя таблицы истории за день с номером day (date.toordinal())"""
+    return f'history_{int(day)}'
+
+
+class Database:
+    """Долгоживущее соединение с базой данных.
+       Обычно на процесс приходится одно соединение, см. get_database.
+       База работает в режиме WAL, поэтому фоновый модуль, читающий базу,
+       не блокирует запись из основного модуля, и наоборот"""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        # Соединением пользуются несколько потоков (например, поток планировщика
+        # и поток управляющего канала в фоновом модуле), поэтому доступ к нему
+        # защищён блокировкой
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        try:
+            self.connection.execute('PRAGMA journal_mode = WAL')
+            # В режиме WAL synchronous = NORMAL не грозит порчей базы,
+            # но избавляет от fsync при каждой транзакции
+            self.connection.execute('PRAGMA synchronous = NORMAL')
+            self.connection.execute(f'PRAGMA cache_size = {-CACHE_SIZE_KB}')
+            self.connection.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+            self.connection.execute('PRAGMA foreign_keys = ON')
+            migrate(self.connection, os.path.dirname(path))
+        except sqlite3.Error:
+            # Например, файл - не база данных sqlite
+            self.connection.close()
+            raise
+        # Последние прочитанные тексты напоминаний: "id: текст", от давних к недавним
+        self.texts = OrderedDict()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+        if _databases.get(self.path) is self:
+            del _databases[self.path]
+
+    def load(self):
+        """Возвращает поля всех напоминаний:
+           (time, title, text, included, week_mask, date_ordinals, repeating_mode, song, id).
+           date_ordinals - отсортированные номера дней (date.toordinal()).
+           Тексты не читаются (text - None): они нужны редко, а занимают
+           больше всего памяти. Текст напоминания возвращает метод text"""
+        with self.lock:
+            date_ordinals = {}
+            for id_, date in self.connection.execute(SELECT_DATES):
+                date_ordinals.setdefault(id_, []).append(date)
+            rows = self.connection.execute(SELECT_SCHEDULES).fetchall()
+            self.texts.clear()
+        return self._notifications(rows, date_ordinals)
+
+    def load_by_ids(self, ids):
+        """Как load, но возвращает только напоминания с id из ids
+           (удалённых из базы напоминаний среди них не будет)"""
+        ids = list(ids)
+        ids_json = json.dumps(ids)
+        with self.lock:
+            date_ordinals = {}
+            for id_, date in self.connection.execute(SELECT_DATES_BY_IDS, (ids_json,)):
+                date_ordinals.setdefault(id_, []).append(date)
+            rows = self.connection.execute(SELECT_SCHEDULES_BY_IDS, (ids_json,)).fetchall()
+            # Перечитываемые напоминания изменились, и их тексты тоже могли измениться
+            for id_ in ids:
+                self.texts.pop(id_, None)
+        return self._notifications(rows, date_ordinals)
+
+    @staticmethod
+    def _notifications(rows, date_ordinals):
+        for id_, time, title, text, included, week_mask, repeating_mode, song in rows:
+            yield (dt.datetime.fromisoformat(time), str(title),
+                   None if text is None else str(text), bool(included),
+                   week_mask, date_ordinals.get(id_, ()), repeating_mode, parse_song(song),
+                   id_)
+
+    def text(self, id_):
+        """Возвращает текст напоминания id_ (пустую строку, если его нет в базе).
+           TEXT_CACHE_SIZE последних прочитанных текстов хранятся в памяти"""
+        with self.lock:
+            text = self.texts.get(id_)
+            if text is not None:
+                self.texts.move_to_end(id_)
+                return text
+            row = self.connection.execute(SELECT_TEXT, (id_,)).fetchone()
+            text = '' if row is None or row[0] is None else str(row[0])
+            self._remember_text(id_, text)
+            return text
+
+    def _remember_text(self, id_, text):
+        self.texts[id_] = text
+        self.texts.move_to_end(id_)
+        if len(self.texts) > TEXT_CACHE_SIZE:
+            self.texts.popitem(last=False)
+
+    def data_version(self):
+        """Число, которое меняется, когда базу изменило другое соединение
+           (в том числе из другого процесса). Узнать его почти ничего не стоит"""
+        with self.lock:
+            return self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+    def last_change(self):
+        """Номер последней записи журнала изменений"""
+        with self.lock:
+            return self.connection.execute(SELECT_LAST_CHANGE).fetchone()[0]
+
+    def changes_since(self, seq):
+        """Возвращает (номер последней записи журнала изменений,
+           множество id напоминаний, изменившихся после записи seq)"""
+        with self.lock, self.connection:
+            # Оба запроса читают один и тот же снимок базы
+            self.connection.execute('BEGIN')
+            last = self.connection.execute(SELECT_LAST_CHANGE).fetchone()[0]
+            ids = {id_ for id_, in self.connection.execute(SELECT_CHANGES, (seq, last))}
+        return last, ids
+
+    def trim_changes(self, seq):
+        """Удаляет из журнала изменений записи до seq включительно"""
+        with self.lock, self.connection:
+            self.connection.execute(DELETE_CHANGES, (seq,))
+
+    def save(self, changed, removed_ids):
+        """Одной транзакцией удаляет напоминания с id из removed_ids
+           и записывает изменённые напоминания changed.
+           Новым напоминаниям (id равен None) присваиваются id из базы данных.
+           Незагруженные тексты (см. Notification.text) в базе не меняются"""
+        with self.lock, self.connection:
+            cursor = self.connection.cursor()
+            # Даты удалённых напоминаний удаляются каскадно
+            cursor.executemany(DELETE_NOTIFICATION, [(id_,) for id_ in removed_ids])
+            cursor.executemany(UPSERT_NOTIFICATION,
+                               [(notify.id, format_time(notify.time), notify.title,
+                                 notify.loaded_text, notify.included,
+                                 notify.week_mask, notify.repeating_mode,
+                                 format_song(notify.song))
+                                for notify in changed if notify.id is not None])
+            for notify in changed:
+                if notify.id is None:
+                    cursor.execute(INSERT_NOTIFICATION,
+                                   (format_time(notify.time), notify.title, notify.text,
+                                    notify.included, notify.week_mask,
+                                    notify.repeating_mode, format_song(notify.song)))
+                    notify.id = cursor.lastrowid
+            # Даты изменённых напоминаний переписываются целиком
+            cursor.executemany(DELETE_DATES, [(notify.id,) for notify in changed])
+            cursor.executemany(INSERT_DATE, [(notify.id, ordinal)
+                                             for notify in changed
+                                             for ordinal in notify.date_ordinals])
+            for id_ in removed_ids:
+                self.texts.pop(id_, None)
+            for notify in changed:
+                if notify.loaded_text is not None:
+                    self._remember_text(notify.id, notify.loaded_text)
+
+    def search(self, query):
+        """Возвращает множество id напоминаний, в заголовке или тексте
+           которых есть все слова из query (слова ищутся и как начала слов).
+           Ищет по полнотекстовому индексу, не читая сами тексты"""
+        words = query.split()
+        if not words:
+            return set()
+        # Каждое слово берётся в кавычки, чтобы знаки в запросе
+        # не разбирались как синтаксис FTS5
+        match = ' '.join('"' + word.replace('"', '""') + '"*' for word in words)
+        with self.lock:
+            return {id_ for id_, in self.connection.execute(SEARCH_NOTIFICATIONS, (match,))}
+
+    def export(self):
+        """Построчно отдаёт поля всех напоминаний в порядке id:
+           (id, time, title, text, included, week_mask, repeating_mode, song, date_ordinals),
+           время - строкой в том виде, в котором оно хранится в базе.
+           В отличие от load, не читает всю базу в память: напоминания и даты
+           читаются двумя курсорами параллельно. Пока генератор не исчерпан,
+           другие потоки процесса не могут пользоваться соединением"""
+        with self.lock:
+            dates = self.connection.execute(SELECT_DATES)
+            date = dates.fetchone()
+            for id_, time, title, text, included, week_mask, repeating_mode, song \
+                    in self.connection.execute(SELECT_NOTIFICATIONS):
+                date_ordinals = []
+                # Даты отсортированы по id напоминания, как и сами напоминания
+                while date is not None and date[0] <= id_:
+                    if date[0] == id_:
+                        date_ordinals.append(date[1])
+                    date = dates.fetchone()
+                # NULL выгружается пустой строкой, а не строкой 'None'
+                yield (id_, time, '' if title is None else str(title),
+                       '' if text is None else str(text), bool(included), week_mask,
+                       repeating_mode, parse_song(song), date_ordinals)
+
+    def import_rows(self, rows, batch_size=10000):
+        """Добавляет в базу новые напоминания из итератора rows с элементами
+           (time, title, text, included, week_mask, repeating_mode, song, date_ordinals).
+           Строки записываются пачками по batch_size через executemany,
+           в одной транзакции. Возвращает число добавленных напоминаний"""
+        count = 0
+        with self.lock, self.connection:
+            # Транзакция сразу берёт блокировку записи, поэтому id,
+            # следующие за последним выданным, никто другой занять не успеет.
+            # id удалённых напоминаний не выдаются снова: на них могут ссылаться
+            # отложенные уведомления и история
+            self.connection.execute('BEGIN IMMEDIATE')
+            next_id = self.connection.execute(SELECT_LAST_ID).fetchone()[0] + 1
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) == batch_size:
+                    self._insert_batch(batch, next_id + count)
+                    count += len(batch)
+                    batch.clear()
+            self._insert_batch(batch, next_id + count)
+            count += len(batch)
+        return count
+
+    def _insert_batch(self, rows, first_id):
+        self.connection.executemany(UPSERT_NOTIFICATION,
+                                    [(id_, format_time(time), title, text, included,
+                                      week_mask, repeating_mode, format_song(song))
+                                     for id_, (time, title, text, included, week_mask,
+                                               repeating_mode, song, _)
+                                     in enumerate(rows, first_id)])
+        self.connection.executemany(INSERT_DATE, [(id_, ordinal)
+                                                  for id_, row in enumerate(rows, first_id)
+                                                  for ordinal in row[-1]])
+
+    def load_snoozes(self):
+        """Возвращает отложенные уведомления:
+           (id, notification_id, title, text, song, fire_at)"""
+        with self.lock:
+            rows = self.connection.execute(SELECT_SNOOZES).fetchall()
+        return [(id_, notification_id, title, text, song, dt.datetime.fromisoformat(fire_at))
+                for id_, notification_id, title, text, song, fire_at in rows]
+
+    def add_snooze(self, notification_id, title, text, song, fire_at):
+        """Сохраняет отложенное уведомление и возвращает его id"""
+        with self.lock, self.connection:
+            cursor = self.connection.execute(INSERT_SNOOZE, (notification_id, title, text,
+                                                             song, format_time(fire_at)))
+            return cursor.lastrowid
+
+    def delete_snoozes(self, ids):
+        with self.lock, self.connection:
+            self.connection.executemany(DELETE_SNOOZE, [(id_,) for id_ in ids])
+
+    def add_history(self, events):
+        """Одной транзакцией записывает в историю события - кортежи
+           (time, event, notification_id, title). Каждое событие попадает
+           в таблицу своего дня, а таблицы дней старше HISTORY_DAYS
+           (считая от последнего дня с событиями) удаляются"""
+        by_day = {}
+        for time, event, notification_id, title in events:
+            by_day.setdefault(time.toordinal(), []).append(
+                (time.isoformat(' '), event, notification_id, title))
+        if not by_day:
+            return
+        with self.lock, self.connection:
+            # Таблицы дней заводят и удаляют разные процессы, поэтому
+            # список дней читается уже под блокировкой записи
+            self.connection.execute('BEGIN IMMEDIATE')
+            days = {day for day, in self.connection.execute(SELECT_HISTORY_DAYS)}
+            for day, rows in by_day.items():
+                table = history_table(day)
+                if day not in days:
+                    self.connection.execute(CREATE_HISTORY_TABLE.format(table=table))
+                    self.connection.execute(CREATE_HISTORY_INDEX.format(table=table))
+                    self.connection.execute(INSERT_HISTORY_DAY, (day,))
+                    days.add(day)
+                self.connection.executemany(INSERT_HISTORY.format(table=table), rows)
+            self._drop_history_before(max(days) - HISTORY_DAYS + 1, days)
+
+    def _drop_history_before(self, first_day, days):
+        for day in sorted(days):
+            if day >= first_day:
+                break
+            self.connection.execute(DROP_HISTORY_TABLE.format(table=history_table(day)))
+            self.connection.execute(DELETE_HISTORY_DAY, (day,))
+
+    def history(self, start, end):
+        """Возвращает события истории со временем от start до end (не включая end)
+           по возрастанию времени: (time, event, notification_id, title).
+           Читаются только таблицы дней, попадающих в промежуток"""
+        rows = []
+        with self.lock, self.connection:
+            # Все таблицы читаются из одного снимка базы
+            self.connection.execute('BEGIN')
+            for day, in self.connection.execute(SELECT_HISTORY_DAYS).fetchall():
+                if start.toordinal() <= day <= end.toordinal():
+                    rows += self.connection.execute(
+                        SELECT_HISTORY.format(table=history_table(day)),
+                        (start.isoformat(' '), end.isoformat(' '))).fetchall()
+        return [(dt.datetime.fromisoformat(time), event, notification_id, title)
+                for time, event, notification_id, title in rows]
+
+
+_databases = {}  # Открытые в этом процессе базы данных: "путь: Database"
+
+
+def get_database(path=DB_PATH):
+    """Возвращает соединение с базой данных, общее для всего процесса"""
+    database = _databases.get(path)
+    if database is None:
+        database = _databases[path] = Database(path)
+    return database
+
+
+def close_database(path=DB_PATH):
+    """Закрывает соединение с базой данных path, если оно открыто в этом процессе"""
+    database = _databases.get(path)
+    if database is not None:
+        database.close()
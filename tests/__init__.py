@@ -0,0 +1 @@
+"""Тесты: python -m unittest (или python -m pytest) из корня проекта"""
@@ -0,0 +1,57 @@
+"""Фоновый модуль подхватывает изменения базы данных, сделанные другим процессом"""
+import datetime as dt
+import os
+import shutil
+import tempfile
+import unittest
+import storage
+from background_working import BackgroundWorker
+from core import Notification
+
+
+class ApplyChangesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.realpath(os.path.join(self.directory, 'test.db'))
+        self.time = (dt.datetime.now() + dt.timedelta(days=1)).replace(second=0, microsecond=0)
+        self.kept, self.edited, self.removed = [
+            Notification(self.time, title, '', profile=self.path)
+            for title in ('kept', 'edited', 'removed')]
+        storage.get_database(self.path).save([self.kept, self.edited, self.removed], [])
+        self.worker = BackgroundWorker()
+        self.profile = self.worker.add_profile(self.path)
+
+    def tearDown(self):
+        self.worker.remove_profile(self.path)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def scheduled(self):
+        """Запланированные напоминания профиля: "заголовок: время прихода\""""
+        return {notify.title: entry[0]
+                for (profile, notify), entry in self.worker.scheduler._entries.items()}
+
+    def test_apply_changes(self):
+        self.assertEqual(self.scheduled(), dict.fromkeys(('kept', 'edited', 'removed'),
+                                                         self.time))
+        kept = self.profile.notifys[self.kept.id]
+        # Изменения из другого соединения (например, из основного модуля)
+        other = storage.Database(self.path)
+        try:
+            self.edited.time = self.time + dt.timedelta(hours=1)
+            added = Notification(self.time, 'added', '', profile=self.path)
+            other.save([self.edited, added], [self.removed.id])
+        finally:
+            other.close()
+        self.worker.apply_changes(self.profile)
+        self.assertEqual(self.scheduled(), {'kept': self.time,
+                                            'edited': self.time + dt.timedelta(hours=1),
+                                            'added': self.time})
+        # Неизменённое напоминание не перечитывается
+        self.assertIs(self.profile.notifys[self.kept.id], kept)
+        # Учтённые записи журнала изменений удалены
+        database = storage.get_database(self.path)
+        self.assertEqual(database.changes_since(0)[1], set())
+
+
+if __name__ == '__main__':
+    unittest.main()
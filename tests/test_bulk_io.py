@@ -0,0 +1,99 @@
+"""Импорт и экспорт напоминаний (csv и jsonl)"""
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import storage
+from bulk_io import import_file, export_file
+
+RECORDS = [
+    {'time': '2030-01-01 09:00:00', 'title': 'once', 'text': 'text', 'included': True,
+     'week_mask': storage.ALL_WEEK_DAYS, 'repeating_mode': 0, 'song': 'default', 'dates': []},
+    {'time': '2030-01-01 10:30:00', 'title': 'weekly', 'text': '', 'included': False,
+     'week_mask': 0b0010101, 'repeating_mode': 1, 'song': None, 'dates': []},
+    {'time': '2030-01-01 18:00:00', 'title': 'dates', 'text': 'a, "b"', 'included': True,
+     'week_mask': storage.ALL_WEEK_DAYS, 'repeating_mode': 2, 'song': 'default',
+     'dates': ['2030-01-05', '2030-02-01']},
+]
+
+
+class BulkIOTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database_path = os.path.join(self.directory, 'test.db')
+        self.other_path = os.path.join(self.directory, 'other.db')
+
+    def tearDown(self):
+        storage.close_database(self.database_path)
+        storage.close_database(self.other_path)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def file(self, name, lines=None):
+        path = os.path.join(self.directory, name)
+        if lines is not None:
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write('\n'.join(lines) + '\n')
+        return path
+
+    def import_records(self, records):
+        path = self.file('records.jsonl', [json.dumps(record) for record in records])
+        return import_file(path, self.database_path, io.StringIO())
+
+    def exported(self, database_path):
+        path = self.file('exported.jsonl')
+        export_file(path, database_path)
+        with open(path, encoding='utf-8') as file:
+            return [json.loads(line) for line in file]
+
+    def test_round_trip(self):
+        self.assertEqual(self.import_records(RECORDS), len(RECORDS))
+        self.assertEqual(self.exported(self.database_path), RECORDS)
+        # Выгруженный файл загружается обратно без изменений, в том числе через csv
+        for name in ('copy.jsonl', 'copy.csv'):
+            with self.subTest(name):
+                storage.close_database(self.other_path)
+                if os.path.exists(self.other_path):
+                    os.remove(self.other_path)
+                path = self.file(name)
+                export_file(path, self.database_path)
+                self.assertEqual(import_file(path, self.other_path, io.StringIO()),
+                                 len(RECORDS))
+                self.assertEqual(self.exported(self.other_path), RECORDS)
+
+    def test_invalid_lines_are_skipped(self):
+        valid = json.dumps(RECORDS[0])
+        path = self.file('records.jsonl', [
+            valid,
+            'not json',
+            '["x"]',
+            json.dumps(dict(RECORDS[0], time='yesterday')),
+            json.dumps(dict(RECORDS[0], title='x' * 100)),
+            json.dumps(dict(RECORDS[1], week_mask=0)),
+            valid,
+        ])
+        errors = io.StringIO()
+        self.assertEqual(import_file(path, self.database_path, errors), 2)
+        self.assertEqual([line.split(':')[1] for line in errors.getvalue().splitlines()],
+                         ['2', '3', '4', '5', '6'])
+
+    def test_deleted_ids_are_not_reused(self):
+        self.import_records(RECORDS)
+        database = storage.get_database(self.database_path)
+        last_id = max(row[0] for row in database.export())
+        database.save([], [last_id])
+        self.import_records(RECORDS[:1])
+        self.assertEqual(max(row[0] for row in database.export()), last_id + 1)
+
+    def test_null_text_is_exported_empty(self):
+        self.import_records(RECORDS[:1])
+        database = storage.get_database(self.database_path)
+        with database.connection:
+            database.connection.execute('UPDATE notifications SET title = NULL, text = NULL')
+        record, = self.exported(self.database_path)
+        self.assertEqual((record['title'], record['text']), ('', ''))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+"""Запоминание времени прихода напоминания (Notification.next_time)"""
+import datetime as dt
+import unittest
+from core import Notification, NotificationError
+from metrics import get_metrics
+from recurrence import clock_epoch
+
+
+def counters():
+    counters = get_metrics().snapshot()['counters']
+    return counters.get('next_time_cache_hits', 0), counters.get('next_time_cache_misses', 0)
+
+
+class NextTimeCacheTest(unittest.TestCase):
+    def setUp(self):
+        time = (dt.datetime.now() + dt.timedelta(days=1)).replace(second=0, microsecond=0)
+        self.notify = Notification(time, 'title', '', repeating_mode=1)
+
+    def assertCounted(self, hits, misses):
+        before = counters()
+        try:
+            self.notify.next_time()
+        except NotificationError:
+            pass
+        after = counters()
+        self.assertEqual((after[0] - before[0], after[1] - before[1]), (hits, misses))
+
+    def test_hit(self):
+        self.assertCounted(0, 1)
+        self.assertCounted(1, 0)
+
+    def test_schedule_fields_invalidate(self):
+        self.notify.next_time()
+        self.notify.title = 'other title'
+        self.notify.text = 'other text'
+        self.assertCounted(1, 0)
+        for field, value in (('time', self.notify.time + dt.timedelta(hours=1)),
+                             ('week_mask', 0b1), ('repeating_mode', 2),
+                             ('included', True), ('date_ordinals', [])):
+            with self.subTest(field):
+                setattr(self.notify, field, value)
+                self.assertCounted(0, 1)
+
+    def test_new_time_after_edit(self):
+        self.notify.repeating_mode = 0
+        old = self.notify.next_time()
+        self.notify.time = self.notify.time + dt.timedelta(hours=1)
+        self.assertEqual(self.notify.next_time(), old + dt.timedelta(hours=1))
+
+    def test_delivery_invalidates(self):
+        self.notify.next_time()
+        self.notify.forget_next_time()
+        self.assertCounted(0, 1)
+
+    def test_clock_jump_invalidates(self):
+        self.notify.next_time()
+        # Смена дня (а затем и перевод часов назад) меняет эпоху часов
+        clock_epoch(dt.datetime.now() + dt.timedelta(days=1))
+        self.assertCounted(0, 1)
+
+    def test_next_time_after(self):
+        # Напоминание, присланное чуть раньше срока, в следующий раз приходит позже него
+        time = self.notify.next_time()
+        self.assertEqual(self.notify.next_time(time), time + dt.timedelta(days=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
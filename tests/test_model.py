@@ -0,0 +1,73 @@
+"""Режим "ближайшие" списка напоминаний: строки перемещаются по одной"""
+import datetime as dt
+import os
+import unittest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+try:
+    from PyQt5.QtWidgets import QApplication
+    from Noty import NotifyListModel
+except ImportError as error:
+    # Например, ресурсы интерфейса (ui_resources) ещё не скомпилированы
+    raise unittest.SkipTest(f'Интерфейс недоступен: {error}')
+from core import Notification
+
+
+class UpcomingTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.application = QApplication.instance() or QApplication([])
+
+    def setUp(self):
+        self.start = (dt.datetime.now() + dt.timedelta(days=1)).replace(second=0,
+                                                                         microsecond=0)
+        self.notifys = [Notification(self.start + dt.timedelta(hours=hours), str(hours), '')
+                        for hours in (3, 1, 4, 2)]
+        self.model = NotifyListModel(self.notifys)
+        self.model.set_upcoming(True)
+        self.moves = []
+        self.model.rowsMoved.connect(
+            lambda parent, start, end, destination, row: self.moves.append((start, row)))
+        self.model.modelReset.connect(lambda: self.fail('Список перестроен целиком'))
+
+    def titles(self):
+        return [self.model.data(self.model.index(row)) for row in range(self.model.rowCount())]
+
+    def test_sorted_by_next_time(self):
+        self.assertEqual(self.titles(), ['1', '2', '3', '4'])
+
+    def test_edit_moves_one_row(self):
+        notify = self.notifys[2]  # '4'
+        notify.time = self.start
+        self.model.update(notify)
+        self.assertEqual(self.titles(), ['4', '1', '2', '3'])
+        self.assertEqual(self.moves, [(3, 0)])
+        notify.time = self.start + dt.timedelta(hours=2, minutes=30)
+        self.model.update(notify)
+        self.assertEqual(self.titles(), ['1', '2', '4', '3'])
+        self.assertEqual(self.moves, [(3, 0), (0, 3)])
+
+    def test_unchanged_order_does_not_move(self):
+        notify = self.notifys[1]  # '1'
+        notify.time = notify.time + dt.timedelta(minutes=30)
+        self.model.update(notify)
+        self.assertEqual(self.titles(), ['1', '2', '3', '4'])
+        self.assertEqual(self.moves, [])
+
+    def test_disabled_goes_last(self):
+        notify = self.notifys[1]  # '1'
+        notify.included = False
+        self.model.update(notify)
+        self.assertEqual(self.titles(), ['2', '3', '4', '1'])
+        self.assertEqual(self.moves, [(0, 4)])
+
+    def test_append_and_remove(self):
+        added = Notification(self.start + dt.timedelta(hours=2, minutes=30), 'added', '')
+        self.model.append(added)
+        self.assertEqual(self.titles(), ['1', '2', 'added', '3', '4'])
+        self.model.remove(self.notifys[0])  # '3'
+        self.assertEqual(self.titles(), ['1', '2', 'added', '4'])
+
+
+if __name__ == '__main__':
+    unittest.main()
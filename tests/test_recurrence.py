@@ -0,0 +1,87 @@
+"""Сравнение замкнутых формул recurrence с перебором дней"""
+import datetime as dt
+import random
+import unittest
+from recurrence import next_fire, next_fires, occurrences, ONCE, WEEKLY, DATES
+
+CASES = 5000
+HORIZON = 60  # На сколько дней вперёд перебирает дни оракул
+
+
+def fires_on(mode, time, week_mask, date_ordinals, day):
+    """Приходит ли напоминание в день day (ONCE - только в день time)"""
+    if mode == ONCE:
+        return day == time.date()
+    if mode == WEEKLY:
+        return bool(week_mask >> day.weekday() & 1)
+    return day.toordinal() in date_ordinals
+
+
+def oracle(mode, time, week_mask, date_ordinals, start, end):
+    """Все времена прихода после start и до end - перебором дней"""
+    result = []
+    day = start.date()
+    while day < end.date() + dt.timedelta(1):
+        fire = dt.datetime.combine(day, dt.time(time.hour, time.minute))
+        if start < fire < end and fires_on(mode, time, week_mask, date_ordinals, day):
+            result.append(fire)
+        day += dt.timedelta(1)
+    return result
+
+
+def random_case(rng):
+    now = dt.datetime(2026, 1, 1) + dt.timedelta(seconds=rng.randrange(365 * 24 * 3600),
+                                                 microseconds=rng.randrange(10 ** 6))
+    mode = rng.choice((ONCE, WEEKLY, DATES))
+    # Время близко к now, чтобы чаще попадать на границы "сегодня/завтра"
+    time = (now + dt.timedelta(minutes=rng.randrange(-3 * 24 * 60, 3 * 24 * 60))).replace(
+        second=0, microsecond=0)
+    if rng.random() < 0.2:
+        time = time.replace(hour=now.hour, minute=now.minute)
+    week_mask = rng.randrange(128)
+    today = now.date().toordinal()
+    date_ordinals = sorted(rng.sample(range(today - 5, today + HORIZON // 2),
+                                      rng.randrange(6)))
+    return mode, time, week_mask, date_ordinals, now
+
+
+class RecurrenceTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(2020)
+        self.cases = [random_case(self.rng) for _ in range(CASES)]
+
+    def test_next_fire(self):
+        for mode, time, week_mask, date_ordinals, now in self.cases:
+            expected = oracle(mode, time, week_mask, date_ordinals,
+                              now, now + dt.timedelta(HORIZON))
+            self.assertEqual(next_fire(mode, time, week_mask, date_ordinals, now),
+                             expected[0] if expected else None,
+                             (mode, time, week_mask, date_ordinals, now))
+
+    def test_next_fires(self):
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            self.skipTest('NumPy не установлен')
+        # Векторный вариант считает все напоминания одного момента сразу
+        for now in {case[-1] for case in self.cases[:50]}:
+            cases = [case[:-1] for case in self.cases]
+            date_ordinals = []
+            date_offsets = [0]
+            for case in cases:
+                date_ordinals.extend(case[3])
+                date_offsets.append(len(date_ordinals))
+            times = next_fires([case[0] for case in cases], [case[1] for case in cases],
+                               [case[2] for case in cases], date_ordinals, date_offsets, now)
+            self.assertEqual(times.astype(object).tolist(),
+                             [next_fire(*case, now) for case in cases])
+
+    def test_occurrences(self):
+        for mode, time, week_mask, date_ordinals, now in self.cases[:1000]:
+            end = now + dt.timedelta(self.rng.randrange(1, HORIZON))
+            self.assertEqual(list(occurrences(mode, time, week_mask, date_ordinals, now, end)),
+                             oracle(mode, time, week_mask, date_ordinals, now, end))
+
+
+if __name__ == '__main__':
+    unittest.main()
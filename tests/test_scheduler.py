@@ -0,0 +1,100 @@
+import datetime as dt
+import threading
+import unittest
+from scheduler import Scheduler
+
+
+class SchedulerTest(unittest.TestCase):
+    def test_equal_times(self):
+        # Напоминания на одно и то же время не затирают друг друга
+        scheduler = Scheduler()
+        time = dt.datetime(2030, 1, 1, 9, 0)
+        for name in 'abc':
+            scheduler.schedule(name, time)
+        scheduler.schedule('b', time)  # Повторная постановка заменяет, а не добавляет
+        scheduler.schedule('d', time + dt.timedelta(minutes=1))
+        self.assertEqual(len(scheduler), 4)
+        due = scheduler.pop_due(time)
+        self.assertEqual(sorted(notify for _, notify in due), ['a', 'b', 'c'])
+        self.assertEqual(len(scheduler), 1)
+
+    def test_discard(self):
+        scheduler = Scheduler()
+        time = dt.datetime(2030, 1, 1, 9, 0)
+        scheduler.schedule('a', time)
+        scheduler.schedule('b', time)
+        scheduler.discard('a')
+        self.assertEqual(scheduler.pop_due(time), [(time, 'b')])
+
+    def test_order_and_compaction(self):
+        # Напоминания достаются по времени прихода, а удалённые из середины
+        # кучи не копятся в ней бесконечно
+        scheduler = Scheduler(coalesce_window=0)
+        start = dt.datetime(2030, 1, 1, 9, 0)
+        for minute in range(1000):
+            scheduler.schedule(minute, start + dt.timedelta(minutes=999 - minute))
+        for minute in range(0, 1000, 2):
+            scheduler.discard(minute)
+        self.assertEqual(len(scheduler), 500)
+        self.assertLessEqual(len(scheduler._heap), 2 * len(scheduler) + 32)
+        self.assertEqual(scheduler.next_deadline(), start)
+        due = scheduler.pop_due(start + dt.timedelta(minutes=999))
+        self.assertEqual([notify for _, notify in due], list(range(999, 0, -2)))
+        self.assertIsNone(scheduler.next_deadline())
+
+    def test_run_delivers_equal_times_together(self):
+        scheduler = Scheduler(coalesce_window=0.2)
+        batches = []
+        lateness = []
+        delivered = threading.Event()
+
+        def deliver(due):
+            batches.append(sorted(notify for _, notify in due))
+            lateness.append((dt.datetime.now() - min(time for time, _ in due)).total_seconds())
+            if len(batches) == 2:
+                delivered.set()
+            if len(batches) == 1:
+                # Ошибка при отправке не останавливает планировщик
+                raise RuntimeError
+
+        thread = threading.Thread(target=scheduler.run, args=[deliver], daemon=True)
+        thread.start()
+        time = dt.datetime.now() + dt.timedelta(seconds=0.1)
+        for name in 'ab':
+            scheduler.schedule(name, time)
+        # Напоминание из окна объединения приходит вместе с ближайшими
+        scheduler.schedule('c', time + dt.timedelta(seconds=0.1))
+        scheduler.schedule('d', time + dt.timedelta(seconds=0.5))
+        self.assertTrue(delivered.wait(5))
+        scheduler.stop()
+        thread.join(5)
+        self.assertEqual(batches, [['a', 'b', 'c'], ['d']])
+        # Ближайшее напоминание не ждёт окно объединения
+        self.assertTrue(all(late < 0.15 for late in lateness), lateness)
+
+    def test_run_retries_failed_batch(self):
+        # Напоминания из пачки, которую не удалось прислать, ставятся в очередь снова
+        scheduler = Scheduler(coalesce_window=0)
+        batches = []
+        delivered = threading.Event()
+
+        def deliver(due):
+            batches.append([notify for _, notify in due])
+            if len(batches) == 1:
+                raise RuntimeError
+            delivered.set()
+
+        def retry(time, notify):
+            scheduler.schedule(notify, time + dt.timedelta(seconds=0.1))
+
+        thread = threading.Thread(target=scheduler.run, args=[deliver, retry], daemon=True)
+        thread.start()
+        scheduler.schedule('a', dt.datetime.now())
+        self.assertTrue(delivered.wait(5))
+        scheduler.stop()
+        thread.join(5)
+        self.assertEqual(batches, [['a'], ['a']])
+
+
+if __name__ == '__main__':
+    unittest.main()
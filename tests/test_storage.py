@@ -0,0 +1,258 @@
+"""Хранение напоминаний: перенос данных из исходной базы данных и json файлов
+   (папка database) и запись изменённых напоминаний"""
+import datetime as dt
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import storage
+from core import Notification
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DIR = os.path.join(PROJECT_DIR, 'database')
+SOURCE_FILES = ('notifications_db.db', storage.WEEK_DAYS_FILE, storage.MONTH_DATES_FILE)
+# Открывает базу данных в момент времени, переданный аргументом
+OPEN_SCRIPT = '''import sys, time
+sys.path.insert(0, {project_dir!r})
+import storage
+start = float(sys.argv[2])
+while time.time() < start:
+    pass
+storage.Database(sys.argv[1]).close()
+'''
+
+
+class MigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name in SOURCE_FILES:
+            shutil.copy(os.path.join(SOURCE_DIR, name), self.directory)
+        self.path = os.path.join(self.directory, 'notifications_db.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def read_json(self, name):
+        with open(os.path.join(SOURCE_DIR, name), encoding='utf-8') as file:
+            return json.load(file)
+
+    def test_migration(self):
+        database = storage.Database(self.path)
+        try:
+            version = database.connection.execute('PRAGMA user_version').fetchone()[0]
+            self.assertEqual(version, len(storage.MIGRATIONS))
+            rows = {row[-1]: row for row in database.load()}
+            self.assertTrue(rows)
+            week_days = self.read_json(storage.WEEK_DAYS_FILE)
+            month_dates = self.read_json(storage.MONTH_DATES_FILE)
+            for id_, row in rows.items():
+                _, title, _, _, week_mask, date_ordinals, _, _, _ = row
+                if str(id_) in week_days:
+                    self.assertEqual(storage.mask_to_week_days(week_mask), week_days[str(id_)])
+                self.assertEqual(list(date_ordinals),
+                                 sorted(dt.datetime.strptime(date, '%Y/%m/%d').toordinal()
+                                        for date in month_dates.get(str(id_), [])))
+                # Полнотекстовый индекс построен по уже существующим напоминаниям
+                self.assertIn(id_, database.search(title.split()[0]))
+        finally:
+            database.close()
+        # Повторное открытие ничего не меняет
+        database = storage.Database(self.path)
+        self.assertEqual(len(list(database.load())), len(rows))
+        database.close()
+
+    def test_migrations_can_be_repeated(self):
+        # Процесс, не дождавшийся блокировки, может повторить уже выполненную миграцию
+        storage.Database(self.path).close()
+        connection = sqlite3.connect(self.path)
+        try:
+            for migration in storage.MIGRATIONS:
+                with connection:
+                    migration(connection, self.directory)
+        finally:
+            connection.close()
+        database = storage.Database(self.path)
+        self.assertTrue(list(database.load()))
+        database.close()
+
+    def test_open_while_locked(self):
+        # Обновлённая база открывается без блокировки записи:
+        # пока основной модуль сохраняет напоминания, фоновый модуль не ждёт
+        storage.Database(self.path).close()
+        writer = sqlite3.connect(self.path)
+        try:
+            writer.execute('BEGIN IMMEDIATE')
+            start = time.monotonic()
+            storage.Database(self.path).close()
+            self.assertLess(time.monotonic() - start, 1)
+        finally:
+            writer.close()
+
+    def test_concurrent_first_open(self):
+        # Основной модуль и фоновый модуль открывают ещё не обновлённую базу одновременно
+        script = OPEN_SCRIPT.format(project_dir=PROJECT_DIR)
+        start = str(dt.datetime.now().timestamp() + 1)
+        processes = [subprocess.Popen([sys.executable, '-c', script, self.path, start],
+                                      stderr=subprocess.PIPE) for _ in range(3)]
+        for process in processes:
+            _, errors = process.communicate(timeout=60)
+            self.assertEqual(process.returncode, 0, errors.decode('utf-8', 'replace'))
+        database = storage.Database(self.path)
+        version = database.connection.execute('PRAGMA user_version').fetchone()[0]
+        database.close()
+        self.assertEqual(version, len(storage.MIGRATIONS))
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Тест с пустой базой данных во временной папке"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.db')
+        self.database = storage.get_database(self.path)
+
+    def tearDown(self):
+        storage.close_database(self.path)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def notification(self, title, text='', **fields):
+        return Notification(dt.datetime(2030, 1, 1, 9, 0), title, text, profile=self.path,
+                            **fields)
+
+    def titles(self):
+        return {row[-1]: row[1] for row in self.database.load()}
+
+
+class SaveTest(DatabaseTestCase):
+    def test_ids_are_stable(self):
+        first, second = self.notification('first'), self.notification('second')
+        self.database.save([first, second], [])
+        ids = first.id, second.id
+        self.assertNotIn(None, ids)
+        second.title = 'edited'
+        self.database.save([second], [])
+        self.assertEqual((first.id, second.id), ids)
+        self.assertEqual(self.titles(), {ids[0]: 'first', ids[1]: 'edited'})
+
+    def test_only_changed_rows_are_written(self):
+        first, second = self.notification('first'), self.notification('second')
+        self.database.save([first, second], [])
+        # Напоминание, которое не передано в save, в базе не переписывается
+        with self.database.connection:
+            self.database.connection.execute(
+                "UPDATE notifications SET title = 'outside' WHERE id = ?", (second.id,))
+        first.title = 'edited'
+        self.database.save([first], [])
+        self.assertEqual(self.titles(), {first.id: 'edited', second.id: 'outside'})
+
+    def test_delete_with_dates(self):
+        keep = self.notification('keep')
+        removed = self.notification('removed', repeating_mode=2,
+                                    month_dates=[dt.date(2030, 1, 2), dt.date(2030, 1, 3)])
+        self.database.save([keep, removed], [])
+        self.database.save([], [removed.id])
+        self.assertEqual(self.titles(), {keep.id: 'keep'})
+        dates = self.database.connection.execute('SELECT COUNT(*) FROM notification_dates').fetchone()[0]
+        self.assertEqual(dates, 0)
+
+    def test_no_song(self):
+        # Напоминание без мелодии хранится как 'None' (столбец song - NOT NULL)
+        silent = self.notification('silent', song=None)
+        self.database.save([silent], [])
+        self.assertIsNone(next(iter(self.database.load()))[-2])
+
+
+class LazyTextTest(DatabaseTestCase):
+    def saved(self, text):
+        notify = self.notification('title', text)
+        self.database.save([notify], [])
+        notify.dirty = False
+        notify.unload_text()
+        return notify
+
+    def stored_text(self, notify):
+        return self.database.connection.execute(
+            'SELECT text FROM notifications WHERE id = ?', (notify.id,)).fetchone()[0]
+
+    def test_text_is_read_on_demand(self):
+        notify = self.saved('long text')
+        self.assertIsNone(notify.loaded_text)
+        self.assertEqual(notify.text, 'long text')
+        self.assertEqual([row[2] for row in self.database.load()], [None])
+
+    def test_save_keeps_unloaded_text(self):
+        # Незагруженный текст (NULL в запросе) не затирает текст в базе
+        notify = self.saved('long text')
+        notify.title = 'edited'
+        self.database.save([notify], [])
+        self.assertEqual(self.stored_text(notify), 'long text')
+
+    def test_save_writes_changed_text(self):
+        notify = self.saved('long text')
+        notify.text = ''
+        self.database.save([notify], [])
+        self.assertEqual(self.stored_text(notify), '')
+        storage.close_database(self.path)
+        self.database = storage.get_database(self.path)
+        notify.dirty = False
+        notify.unload_text()
+        self.assertEqual(notify.text, '')
+
+
+class ChangeLogTest(DatabaseTestCase):
+    def test_changes_since_and_trim(self):
+        first, second = self.notification('first'), self.notification('second')
+        self.database.save([first, second], [])
+        seq = self.database.last_change()
+        version = self.database.data_version()
+        # Изменения из другого соединения (например, из основного модуля)
+        other = storage.Database(self.path)
+        try:
+            second.title = 'edited'
+            other.save([second], [])
+            third = self.notification('third')
+            other.save([third], [first.id])
+        finally:
+            other.close()
+        self.assertNotEqual(self.database.data_version(), version)
+        last, ids = self.database.changes_since(seq)
+        self.assertEqual(ids, {first.id, second.id, third.id})
+        self.database.trim_changes(last)
+        self.assertEqual(self.database.changes_since(0)[1], set())
+
+
+class HistoryTest(DatabaseTestCase):
+    def days(self):
+        return [day for day, in self.database.connection.execute(storage.SELECT_HISTORY_DAYS)]
+
+    def test_events_by_day(self):
+        start = dt.datetime(2030, 1, 1, 12, 0)
+        events = [(start + dt.timedelta(days=day, minutes=minute), 'shown', day, 'title')
+                  for day in range(3) for minute in range(2)]
+        self.database.add_history(events)
+        self.assertEqual(self.days(), [start.toordinal() + day for day in range(3)])
+        self.assertEqual(self.database.history(start + dt.timedelta(days=1),
+                                               start + dt.timedelta(days=2)),
+                         events[2:4])
+
+    def test_old_days_are_dropped(self):
+        start = dt.datetime(2030, 1, 1, 12, 0)
+        self.database.add_history([(start, 'shown', 1, 'old')])
+        last = start + dt.timedelta(days=storage.HISTORY_DAYS)
+        self.database.add_history([(last, 'dismissed', 2, 'new')])
+        # Таблица дня, вышедшего за HISTORY_DAYS последних дней, удалена целиком
+        self.assertEqual(self.days(), [last.toordinal()])
+        tables = {name for name, in self.database.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'history_%'")}
+        self.assertEqual(tables, {'history_days', storage.history_table(last.toordinal())})
+        self.assertEqual(self.database.history(start, last + dt.timedelta(days=1)),
+                         [(last, 'dismissed', 2, 'new')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+"""Кэш скомпилированных форм интерфейса.
+
+   Вместо разбора .ui файла (uic.loadUi) при каждом создании окна формы
+   один раз компилируются в python модули (uic.compileUi) и дальше
+   просто импортируются. Скомпилировать все формы заранее можно командой
+   python ui_forms.py"""
+from PyQt5 import uic
+import importlib.util
+import io
+import os
+
+
+UI_DIR = os.path.join('resources', 'ui')
+CACHE_DIR = os.path.join(UI_DIR, 'compiled')
+FORMS = ('EditNotifyWindow', 'CalendarDialog', 'NotifyWindow')
+
+_form_classes = {}  # Уже импортированные классы форм: "имя формы: класс"
+
+
+def ui_path(name):
+    return os.path.join(UI_DIR, name + '.ui')
+
+
+def cache_path(name):
+    return os.path.join(CACHE_DIR, 'ui_' + name + '.py')
+
+
+def is_stale(name):
+    """Устарел ли скомпилированный модуль формы(или его ещё нет)"""
+    try:
+        return os.path.getmtime(cache_path(name)) < os.path.getmtime(ui_path(name))
+    except OSError:
+        return True
+
+
+def compile_form(name):
+    """Компилирует .ui файл формы в python модуль.
+       Модуль сначала пишется во временный файл и появляется под своим именем
+       целиком: основной модуль и процесс notify могут компилировать форму
+       одновременно, и ни один не должен импортировать недописанный модуль"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    source = io.StringIO()
+    with open(ui_path(name), 'r', encoding='utf-8') as ui_file:
+        uic.compileUi(ui_file, source)
+    temp_path = f'{cache_path(name)}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as py_file:
+            # Формы ссылаются на resources.qrc, который скомпилирован в модуль ui_resources
+            py_file.write(source.getvalue().replace('import resources_rc', 'import ui_resources'))
+        os.replace(temp_path, cache_path(name))
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def form_class(name):
+    """Возвращает класс скомпилированной формы, при необходимости компилируя её.
+       Если скомпилировать форму не получилось, возвращает None"""
+    if name in _form_classes:
+        return _form_classes[name]
+    try:
+        if is_stale(name):
+            compile_form(name)
+        spec = importlib.util.spec_from_file_location('ui_' + name, cache_path(name))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        cls = next(value for key, value in vars(module).items() if key.startswith('Ui_'))
+    except Exception:
+        # Например, папка с программой доступна только для чтения
+        cls = None
+    _form_classes[name] = cls
+    return cls
+
+
+def load_form(name, widget):
+    """Строит форму name на виджете widget. Как и uic.loadUi,
+       делает элементы формы атрибутами виджета"""
+    cls = form_class(name)
+    if cls is None:
+        uic.loadUi(ui_path(name), widget)
+        return
+    form = cls()
+    form.setupUi(widget)
+    for attr, value in vars(form).items():
+        setattr(widget, attr, value)
+
+
+if __name__ == '__main__':
+    for form_name in FORMS:
+        compile_form(form_name)
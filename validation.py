@@ -0,0 +1,33 @@
+"""Проверка полей напоминания перед сохранением.
+
+   Одни и те же правила применяются и в окне редактирования
+   (EditNotifyWindow.apply), и при импорте напоминаний из файла (bulk_io)."""
+from recurrence import ONCE, WEEKLY, DATES
+
+
+# Максимальная длина заголовка в символах. В окне редактирования
+# заголовок ещё и должен помещаться на кнопку в списке напоминаний
+MAX_TITLE_LENGTH = 25
+
+
+class ValidationError(ValueError):
+    """Вызывается, если поле напоминания заполнено неверно.
+       field - название неверно заполненного поля"""
+
+    def __init__(self, field, message):
+        super().__init__(message)
+        self.field = field
+
+
+def validate_notification(title, repeating_mode, week_mask, date_ordinals):
+    """Проверяет поля напоминания, при ошибке вызывает ValidationError"""
+    if not title:
+        raise ValidationError('title', 'Не указан заголовок')
+    if len(title) > MAX_TITLE_LENGTH:
+        raise ValidationError('title', 'Слишком длинный заголовок')
+    if repeating_mode not in (ONCE, WEEKLY, DATES):
+        raise ValidationError('repeating_mode', f'Неизвестный режим повтора: {repeating_mode}')
+    if repeating_mode == DATES and not date_ordinals:
+        raise ValidationError('dates', 'Не выбраны даты повтора')
+    if repeating_mode != ONCE and not week_mask:
+        raise ValidationError('week_days', 'Не выбраны дни недели')